@@ -51,8 +51,8 @@ class PipelineMachineConstruct(Construct):
         step_process = self.__get_process_step()
         step_breakup = self.__get_breakup_step()
         step_restart = self.__get_restart_step()
-        step_checkup = self.__get_checkup_step(step_restart, step_process, step_breakup)
         step_standby = self.__get_standby_step()
+        step_checkup = self.__get_checkup_step(step_restart, step_process, step_breakup, step_standby)
 
         step_startup.next(step_promote).next(step_checkup)
         step_process.next(step_standby).next(step_promote)
@@ -144,11 +144,12 @@ class PipelineMachineConstruct(Construct):
 
         return process_chain
 
-    def __get_checkup_step(self, restart_step, process_step, breakup_step):
+    def __get_checkup_step(self, restart_step, process_step, breakup_step, standby_step):
 
         return (
             Choice(self, Manager.CHECKUP)
             .when(Condition.boolean_equals('$.Payload.restartPipeline', True), restart_step)
+            .when(Condition.boolean_equals('$.Payload.skipCycle',       True), standby_step) # nothing pending, wait for the next cycle
             .when(Condition.boolean_equals('$.Payload.processDocument', True), process_step)
             .otherwise(                                                breakup_step)
         )
@@ -349,6 +349,9 @@ class PipelineProcessConstruct(Construct):
     def __create_lambda_function(self, stage, aspect, environ):
 
         environment = self.__common.copy()
+        environment.update({
+            'S3_CACHE_BYTES' : str(256 * 1024 * 1024), # half of the default /tmp of a lambda, e.g. for augment rereading operate and a2i outputs
+        })
         environment.update(environ)
 
         lambda_function = aws_lambda.Function(
@@ -5,9 +5,10 @@ from typing  import List
 from pathlib import Path
 
 from aws_cdk import (
-    aws_lambda, aws_s3, aws_iam, aws_s3_notifications, Duration, 
+    aws_lambda, aws_s3, aws_iam, aws_s3_notifications, aws_dynamodb, Duration, 
     CustomResource
 )
+from aws_cdk.aws_lambda_event_sources import DynamoEventSource
 
 from constructs import Construct
 from aws_cdk.custom_resources import (
@@ -15,7 +16,8 @@ from aws_cdk.custom_resources import (
 )
 
 class Trigger:
-    S3 = 's3'
+    S3     = 's3'
+    STREAM = 'stream'
 
 class PipelineTriggerConstruct(Construct):
     def __init__(
@@ -41,7 +43,8 @@ class PipelineTriggerConstruct(Construct):
 
         self.__trigger_lambdas = {}
 
-        self.__trigger_lambdas[Trigger.S3] = self.__create_lambda_function(Trigger.S3, self.__common)
+        self.__trigger_lambdas[Trigger.S3]     = self.__create_lambda_function(Trigger.S3,     self.__common)
+        self.__trigger_lambdas[Trigger.STREAM] = self.__create_lambda_function(Trigger.STREAM, self.__common)
 
     def get_trigger_lambdas(self):
 
@@ -59,6 +62,29 @@ class PipelineTriggerConstruct(Construct):
             aws_s3.NotificationKeyFilter(prefix = 'acquire/')
         )
 
+    def arm_stream_trigger(self, table : aws_dynamodb.Table, begin_lambdas : dict):
+
+        """
+        Promote documents as soon as a stage reports SUCCESS, the promote manager poll remains as fallback
+        """
+
+        lambda_function = self.__trigger_lambdas[Trigger.STREAM]
+
+        lambda_function.add_event_source(
+            DynamoEventSource(
+                table             = table,
+                starting_position = aws_lambda.StartingPosition.LATEST,
+                batch_size        = 100,
+                retry_attempts    = 3,
+                filters           = [
+                    aws_lambda.FilterCriteria.filter({'eventName' : aws_lambda.FilterRule.is_equal('MODIFY')}),
+                ],
+            )
+        )
+
+        for begin_lambda in begin_lambdas.values():
+            begin_lambda.grant_invoke(lambda_function)
+
     def arm_s3_trigger_delayed(self):
 
         lambda_role = aws_iam.Role(
@@ -108,6 +108,7 @@ class PipelineStack(Stack):
             partition_key   = aws_dynamodb.Attribute(name = table_pk, type = aws_dynamodb.AttributeType.STRING),
           # sort_key        = aws_dynamodb.Attribute(name = table_sk, type = aws_dynamodb.AttributeType.STRING), # do not want sk -> access item with just DocumentID
             removal_policy  = RemovalPolicy.DESTROY,
+            stream          = aws_dynamodb.StreamViewType.NEW_AND_OLD_IMAGES, # feeds the stream trigger
         )
 
         self.__tdd_table_pipeline.add_global_secondary_index(
@@ -127,6 +128,7 @@ class PipelineStack(Stack):
             'SUFFIX'         : self.__suffix,
             'ACCOUNT'        : Aws.ACCOUNT_ID,
             'REGION'         : Aws.REGION,
+            'SHARDS'         : str(self.node.try_get_context('ENVIRONMENTS').get('SHARDS', 1)), # write shards of the progress index key
         }
 
       # Constructs Pipeline Stage Process Lambdas
@@ -179,6 +181,10 @@ class PipelineStack(Stack):
         )
 
         pipeline_trigger_construct.arm_s3_trigger()
+        pipeline_trigger_construct.arm_stream_trigger(
+            table         = self.__tdd_table_pipeline,
+            begin_lambdas = pipeline_process_construct.get_stage_begin_lambdas()
+        )
       # pipeline_trigger_construct.arm_s3_trigger_delayed() # custom resource
 
     def __grant_persistence_permissions(self,
@@ -2,22 +2,22 @@
 # SPDX-License-Identifier: MIT-0
 
 from shared.database import Database
-from shared.defines import Stage
-
-STAGE_TRANSITIONS_ORDER = [Stage.ACQUIRE,
-                           Stage.CONVERT,
-                           Stage.EXTRACT,
-                           Stage.RESHAPE,
-                           Stage.OPERATE,
-                           Stage.AUGMENT,
-                           Stage.CATALOG]
+from shared.defines import State, STAGE_TRANSITIONS_ORDER
 
 def lambda_handler(context, event):
-    for index in range(len(STAGE_TRANSITIONS_ORDER) - 1):
-        current_stage, next_stage = STAGE_TRANSITIONS_ORDER[index], STAGE_TRANSITIONS_ORDER[index + 1]
-        Database.PromoteDocument(current_stage, next_stage)
+
+    promoted = Database.PromoteDocuments(dict(zip(STAGE_TRANSITIONS_ORDER, STAGE_TRANSITIONS_ORDER[1:])))
+  # the progress index lags behind the promotions just written, so these count as pending on their own,
+  # as do documents done with a stage but not yet promoted out of it
+    pending  = (
+        any(promoted.values()) or
+        Database.AnyDocuments(STAGE_TRANSITIONS_ORDER, [State.WAITING, State.HOLDING, State.RUNNING]) or
+        Database.AnyDocuments(STAGE_TRANSITIONS_ORDER[:-1], [State.SUCCESS])
+    )
 
     return {
         'restartPipeline' : False,
         'processDocument' : True,
+        'skipCycle'       : not pending, # checkup stands by without processing, rather than breaking up the pipeline
+        'promoted'        : promoted,
         }
@@ -11,9 +11,8 @@ from shared.database import Database
 from shared.store    import Store
 from shared.bus      import Bus
 
-def lambda_handler(event, context):
+def processDocument(document, publisher):
 
-    document = Document.from_dict(event)
     message  = Message(DocumentID = document.DocumentID)
 
     Logger.info(f'{STAGE} Actor : Started Processing DocumentID = {document.DocumentID}')
@@ -22,12 +21,23 @@ def lambda_handler(event, context):
 
     message.FinalStamp = GetCurrentStamp()
 
-    Bus.PutMessage(stage = STAGE, message_body = message.to_json())
+    publisher.PutMessage(message_body = message.to_json())
 
     Logger.info(f'{STAGE} Actor : Stopped Processing DocumentID = {document.DocumentID}')
 
     return PASS
 
+def lambda_handler(event, context):
+
+    with Bus.Publisher(stage = STAGE) as publisher:
+
+        for document in Database.HydrateDocuments(event):
+
+            if  document:
+                processDocument(document, publisher)
+
+    return None
+
 if  __name__ == '__main__':
 
 	Bus.Purge(stage = STAGE)
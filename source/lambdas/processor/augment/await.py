@@ -21,79 +21,67 @@ class A2IHumanLoopStatus:
 
 class AugmentAwaitProcessor(AwaitProcessor):
 
-    def processCallbackEvents(self):
-        '''
-        Process completion events from asynchronous requests coming through the stage event bus.
-        '''
-
-        for wrapper in Bus.GetMessages(stage = self.stage):
-
-            message                        = DotMap(**loads(wrapper.body))
-            message.detail                 = DotMap(**message.detail)
-            message.detail.humanLoopOutput = DotMap(**message.detail.humanLoopOutput)
-            message.documentID             = message.detail.humanLoopName.split('--')[1]
-            document                       = Database.GetDocument(document_id = message.documentID)
-
-            if not document:
-
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
-                    f'Unable to Find in Database'
-                )
-                wrapper.delete()
-                continue
+    def parseCallbackEvent(self, wrapper):
 
-            if  message.detail.humanLoopStatus in (A2IHumanLoopStatus.Completed, A2IHumanLoopStatus.Stopped):
+        message                        = DotMap(**loads(wrapper.body))
+        message.detail                 = DotMap(**message.detail)
+        message.detail.humanLoopOutput = DotMap(**message.detail.humanLoopOutput)
+        message.documentID             = message.detail.humanLoopName.split('--')[1]
 
-                outputS3Uri = S3Uri.FromUrl(message.detail.humanLoopOutput.outputS3Uri)
-                outputJSON  = outputS3Uri.GetJSON()
-
-                flowName    = search(r':flow-definition/([^/]+)', outputJSON.get('flowDefinitionArn', '')).group(1)
+        return message.documentID, message
 
+    def processCallbackEvent(self, document, message):
+        '''
+        Absorb an A2I human loop status change into its document.
+        '''
 
-                for order, humanAnswer in enumerate(outputJSON.get('humanAnswers', [])):
+        if  message.detail.humanLoopStatus in (A2IHumanLoopStatus.Completed, A2IHumanLoopStatus.Stopped):
 
-                    Logger.info(
-                        f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
-                        f'Processing Human Answer from Workflow → {flowName}'
-                    )
-                    
-                    Logger.pretty(humanAnswer, f'Human Answer {order}')
+            outputS3Uri = S3Uri.FromUrl(message.detail.humanLoopOutput.outputS3Uri)
+            outputJSON  = outputS3Uri.GetJSON()
 
-                    answerContent    =   humanAnswer.get('answerContent', {})
-                    answerSubmission = answerContent.get('submission',  '{}')
-                    answerTabularHIL = loads(answerSubmission)
+            flowName    = search(r':flow-definition/([^/]+)', outputJSON.get('flowDefinitionArn', '')).group(1)
 
-                    S3Uri(Bucket = STORE_BUCKET,
-                          Object = f'{STAGE}/{document.DocumentID}/{flowName}/{order}.json').PutJSON(answerTabularHIL)
 
-                document.State                 = State.SUCCESS
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
-                document.CurrentMap.StageS3Uri = S3Uri(Bucket = STORE_BUCKET,
-                                                       Prefix = f'{STAGE}/{document.DocumentID}/{flowName}') # point to directory as more than one possible answer
+            for order, humanAnswer in enumerate(outputJSON.get('humanAnswers', [])):
 
                 Logger.info(
                     f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
-                    f'Status is PASS'
+                    f'Processing Human Answer from Workflow → {flowName}'
                 )
+                
+                Logger.pretty(humanAnswer, f'Human Answer {order}')
 
-            else:
+                answerContent    =   humanAnswer.get('answerContent', {})
+                answerSubmission = answerContent.get('submission',  '{}')
+                answerTabularHIL = loads(answerSubmission)
 
-                document.State                 = State.FAILURE
-                document.CurrentMap.ActorGrade = FAIL
-                document.CurrentMap.Exceptions = [dumps(message.toDict(), indent = 4)]
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+                S3Uri(Bucket = STORE_BUCKET,
+                      Object = f'{STAGE}/{document.DocumentID}/{flowName}/{order}.json').PutJSON(answerTabularHIL, encoding = 'gzip')
 
-                self.processCallbackEventsMore(message)
+            document.State                 = State.SUCCESS
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
+            document.CurrentMap.StageS3Uri = S3Uri(Bucket = STORE_BUCKET,
+                                                   Prefix = f'{STAGE}/{document.DocumentID}/{flowName}') # point to directory as more than one possible answer
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
-                    f'Status is FAIL'
-                )
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
+                f'Status is PASS'
+            )
+
+        else:
+
+            document.State                 = State.FAILURE
+            document.CurrentMap.ActorGrade = FAIL
+            document.CurrentMap.Exceptions = [dumps(message.toDict(), indent = 4)]
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
 
-            Database.PutDocument(document)
+            self.processCallbackEventsMore(message)
 
-            wrapper.delete()
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received A2I Callback for DocumentID = {message.documentID}, '
+                f'Status is FAIL'
+            )
 
 def lambda_handler(event, context):
     AugmentAwaitProcessor(stage = STAGE, timeoutMinutes = 300).process()
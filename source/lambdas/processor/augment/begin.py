@@ -71,40 +71,66 @@ class AugmentBeginProcessor(BeginProcessor):
 
     def processDocuments(self):
 
-        rateLimited = False
+        """
+        Start a human loop for every ready document, claiming each as RUNNING just beforehand so that a
+        concurrent Begin never starts a second one for it. A document the call fails for is held for a
+        retry on its own, while the ones after it carry on; once A2I pushes back, the documents
+        left over wait for the next cycle untouched.
+        """
 
-        for document in Database.GetDocuments(stages = [self.stage], states = [State.HOLDING, State.WAITING]):
+        for document in self.getDocuments():
 
-            status, result = self.augmentTables(document)
+            claimed, _ = self.claimDocuments({document.DocumentID : document})
+
+            if  not claimed:
+                continue # taken meanwhile by another Begin
+
+            throttled = False
+
+            try:
+
+                status, result = self.augmentTables(document)
+                throttled      = status != PASS
+
+            except Exception as e:
+
+                Logger.error(
+                    f'{self.stage} Begin Processor : Calling A2I for DocumentID = {document.DocumentID}, exception = {e}'
+                )
+
+                status, result = FAIL, None
 
             if  status == PASS:
 
                 Logger.info(
-                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = {status}'
+                    f'{self.stage} Begin Processor : Calling A2I for DocumentID = {document.DocumentID}, Submission = {status}'
                 )
 
                 Logger.pretty(result)
 
-                document.State                 = State.RUNNING
-                document.CurrentMap.StartStamp = GetCurrentStamp()
                 document.CurrentMap.PrimaryHLA = result['HumanLoopArn']
 
             else:
 
                 Logger.info(
-                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = {status}'
+                    f'{self.stage} Begin Processor : Calling A2I for DocumentID = {document.DocumentID}, Submission = {status}'
                 )
 
                 document.State                  = State.HOLDING
                 document.CurrentMap.RetryCount += 1
 
-                rateLimited = True
+                if  document.CurrentMap.RetryCount > self.retryLimit:
+                    document.State = State.FAILURE
 
-            Database.PutDocument(document)
+          # written at once, as the callback may settle the document before a buffered write would go out
+            if  Database.UpdateDocument(document) != PASS:
+                Logger.error(
+                    f'{self.stage} Begin Processor : Unable to Record Submission for DocumentID = {document.DocumentID}'
+                )
 
-            if  rateLimited:
+            if  throttled:
                 break
 
 def lambda_handler(event, context):
 
-    AugmentBeginProcessor(stage = STAGE, actor = None, retryLimit = 5, maxPendingLoops = 5).process()
+    AugmentBeginProcessor(stage = STAGE, actor = None, retryLimit = 5, maxPendingLoops = 5, budget = 5).process()
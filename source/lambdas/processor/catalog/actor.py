@@ -5,6 +5,7 @@ from shared.defines import *
 from shared.environ import *
 from shared.helpers import *
 
+from shared.database import Database
 from shared.document import Document
 from shared.storage  import S3Uri
 from shared.message  import Message
@@ -12,10 +13,8 @@ from shared.bus      import Bus
 
 from utils import ExcelHelper
 
-def lambda_handler(event, context):
+def processDocument(document, publisher, helper):
     
-    helper   = ExcelHelper()
-    document = Document.from_dict(event)
     message  = Message(document.DocumentID)
 
     message.DocumentID            = document.DocumentID
@@ -25,8 +24,12 @@ def lambda_handler(event, context):
 
         Logger.info(f'{STAGE} Actor : Started Processing DocumentID = {document.DocumentID}')
 
-        for n, humanAnswer in enumerate(document.AugmentMap.StageS3Uri.List()):
-            xlsxContent = helper.convert(humanAnswer.GetJSON())
+        humanAnswers = list(document.AugmentMap.StageS3Uri.List())
+        numbers      = {humanAnswer.Key : n for n, humanAnswer in enumerate(humanAnswers)} # listing order, whichever download lands first
+
+        for humanAnswer, answerContent in S3Uri.GetMany(humanAnswers, reader = S3Uri.GetJSON):
+            n           = numbers[humanAnswer.Key]
+            xlsxContent = helper.convert(answerContent)
             S3Uri(Bucket = STORE_BUCKET, Object = f'{STAGE}/{document.DocumentID}/{n}.xlsx').Put(xlsxContent)
 
         Logger.info(f'{STAGE} Actor : Stopped Processing DocumentID = {document.DocumentID}')
@@ -45,7 +48,20 @@ def lambda_handler(event, context):
         message.ActorGrade = Grade.PASS
         message.FinalStamp = GetCurrentStamp()
 
-    Bus.PutMessage(stage = STAGE, message_body = message.to_json())
+    publisher.PutMessage(message_body = message.to_json())
+
+    return None
+
+def lambda_handler(event, context):
+
+    helper = ExcelHelper()
+
+    with Bus.Publisher(stage = STAGE) as publisher:
+
+        for document in Database.HydrateDocuments(event):
+
+            if  document:
+                processDocument(document, publisher, helper)
 
     return None
 
@@ -13,9 +13,8 @@ from shared.bus      import Bus
 
 from utils import ImageHelper
 
-def lambda_handler(event, context):
+def processDocument(document, publisher):
 
-    document = Document.from_dict(event)
     message  = Message(DocumentID = document.DocumentID)
 
     try:
@@ -32,11 +31,11 @@ def lambda_handler(event, context):
 
             outputBlob = ImageHelper(imageBytes = sourceS3Uri.Get()).convert(outputType = 'pdf')
 
-        else:
+            outputS3Uri.Put(outputBlob)
 
-            outputBlob = sourceS3Uri.Get()
+        else:
 
-        outputS3Uri.Put(outputBlob) # copy document over
+            sourceS3Uri.CopyTo(outputS3Uri) # copy document over, server side
 
         message.MapUpdates.StageS3Uri = outputS3Uri
         message.FinalStamp            = GetCurrentStamp()
@@ -52,11 +51,22 @@ def lambda_handler(event, context):
 
         Logger.info(f'{STAGE} Actor : Errored Processing DocumentID = {document.DocumentID}')
 
-    Bus.PutMessage(stage = STAGE, message_body = message.to_json())
+    publisher.PutMessage(message_body = message.to_json())
 
     return None
 
 
+def lambda_handler(event, context):
+
+    with Bus.Publisher(stage = STAGE) as publisher:
+
+        for document in Database.HydrateDocuments(event):
+
+            if  document:
+                processDocument(document, publisher)
+
+    return None
+
 if  __name__ == '__main__':
 
     STAGE = Stage.CONVERT
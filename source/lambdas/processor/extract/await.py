@@ -19,53 +19,42 @@ class ExtractAwaitProcessor(AwaitProcessor):
 
         pass
 
-    def processCallbackEvents(self):
+    def parseCallbackEvent(self, wrapper):
 
-        """
-        Process completion events from asynchronous requests coming through the stage event bus.
-        """
-
-        for wrapper in Bus.GetMessages(stage = self.stage):
-
-            response = DotMap(**loads(wrapper.body))
-            message  = DotMap(**loads(response.Message))
-            document = Database.GetDocument(document_id = message.JobTag)
+        response = DotMap(**loads(wrapper.body))
+        message  = DotMap(**loads(response.Message))
 
-            if  not document:
+        return message.JobTag, message
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.JobTag}, Unable to Find in Database'
-                )
-                wrapper.delete()
-                continue
+    def processCallbackEvent(self, document, message):
 
-            if  message.Status == TextractStatus.SUCCEEDED:
-
-                document.State = State.SUCCESS
+        """
+        Absorb a Textract completion notification into its document.
+        """
 
-                self.extractTextractResponse(message)
-                self.processCallbackEventsMore(message)
+        if  message.Status == TextractStatus.SUCCEEDED:
 
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+            document.State = State.SUCCESS
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received TEXTRACT Callback for DocumentID = {message.JobTag}, Status is PASS'
-                )
+            self.extractTextractResponse(message)
+            self.processCallbackEventsMore(message)
 
-            else:
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
 
-                document.State                 = State.FAILURE
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received TEXTRACT Callback for DocumentID = {message.JobTag}, Status is PASS'
+            )
 
-                self.processCallbackEventsMore(message)
+        else:
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received TEXTRACT Callback for DocumentID = {message.JobTag}, Status is FAIL'
-                )
+            document.State                 = State.FAILURE
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
 
-            Database.PutDocument(document)
+            self.processCallbackEventsMore(message)
 
-            wrapper.delete()
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received TEXTRACT Callback for DocumentID = {message.JobTag}, Status is FAIL'
+            )
 
 def lambda_handler(event, context):
 
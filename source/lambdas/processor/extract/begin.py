@@ -60,39 +60,65 @@ class ExtractBeginProcessor(BeginProcessor):
 
     def processDocuments(self):
 
-        rateLimited = False
+        """
+        Start a Textract job for every ready document, claiming each as RUNNING just beforehand so that a
+        concurrent Begin never starts a second one for it. A document the call fails for is held for a
+        retry on its own, while the ones after it carry on; once Textract pushes back, the documents
+        left over wait for the next cycle untouched.
+        """
 
-        for document in Database.GetDocuments(stages = [self.stage], states = [State.HOLDING, State.WAITING]):
+        for document in self.getDocuments():
 
-            status, result = self.extractTables(document)
+            claimed, _ = self.claimDocuments({document.DocumentID : document})
+
+            if  not claimed:
+                continue # taken meanwhile by another Begin
+
+            throttled = False
+
+            try:
+
+                status, result = self.extractTables(document)
+                throttled      = status != PASS
+
+            except Exception as e:
+
+                Logger.error(
+                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, exception = {e}'
+                )
+
+                status, result = FAIL, None
 
             if  status == PASS:
 
                 Logger.info(
-                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = PASS'
+                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = {status}'
                 )
 
                 Logger.pretty(result)
 
-                document.State                 = State.RUNNING
-                document.CurrentMap.StartStamp = GetCurrentStamp()
                 document.CurrentMap.TextractID = result['JobId']
                 document.CurrentMap.StageS3Uri = S3Uri(Bucket = STORE_BUCKET, Prefix = f'{STAGE}/{document.DocumentID}/{document.CurrentMap.TextractID}')
 
             else:
 
                 Logger.info(
-                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = FAIL'
+                    f'{self.stage} Begin Processor : Calling Textract for DocumentID = {document.DocumentID}, Submission = {status}'
                 )
 
                 document.State                  = State.HOLDING
                 document.CurrentMap.RetryCount += 1
 
-                rateLimited = True
+                if  document.CurrentMap.RetryCount > self.retryLimit:
+                    document.State = State.FAILURE
 
-            Database.PutDocument(document)
+          # written at once, as the callback may settle the document before a buffered write would go out
+            if  Database.UpdateDocument(document) != PASS:
+                Logger.error(
+                    f'{self.stage} Begin Processor : Unable to Record Submission for DocumentID = {document.DocumentID}'
+                )
 
-            if  rateLimited:
+            if  throttled:
                 break
 
 def lambda_handler(event, context):
@@ -6,6 +6,7 @@ from shared.environ import *
 from shared.helpers import GetCurrentStamp
 from shared.loggers import Logger
 
+from shared.database import Database
 from shared.document import Document
 from shared.storage  import S3Uri
 from shared.message  import Message
@@ -14,9 +15,8 @@ from shared.bus      import Bus
 from traceback import print_exc
 from typing    import List
 
-def lambda_handler(event, context):
+def processDocument(document, publisher):
 
-    document = Document.from_dict(event)
     message  = Message(DocumentID = document.DocumentID)
 
     Logger.info(f'{STAGE} Actor : Started Processing DocumentID = {document.DocumentID}')
@@ -37,7 +37,7 @@ def lambda_handler(event, context):
                 table['tableType'] = None
                 table['headerColumnTypes'] = {}
 
-        outputS3Uri.PutJSON(body = hil_document)
+        outputS3Uri.PutJSON(body = hil_document, encoding = 'gzip')
 
         Logger.info(f'{STAGE} Actor : Stopped Processing DocumentID = {document.DocumentID}')
 
@@ -54,7 +54,7 @@ def lambda_handler(event, context):
     message.MapUpdates.StageS3Uri = outputS3Uri
     message.FinalStamp            = GetCurrentStamp()
 
-    Bus.PutMessage(stage = STAGE, message_body = message.to_json())
+    publisher.PutMessage(message_body = message.to_json())
 
 def get_operate_table_types() -> List[str]:
     """
@@ -99,6 +99,17 @@ def get_operate_table_types() -> List[str]:
             ]
         },    ]
 
+def lambda_handler(event, context):
+
+    with Bus.Publisher(stage = STAGE) as publisher:
+
+        for document in Database.HydrateDocuments(event):
+
+            if  document:
+                processDocument(document, publisher)
+
+    return None
+
 if  __name__ == '__main__':
 
     lambda_handler({'DocumentID': '001'}, None)
@@ -8,6 +8,7 @@ from shared.helpers import GetCurrentStamp
 from shared.message import ReshapeMapUpdates
 from shared.clients import TextractClient, S3Client
 
+from shared.database import Database
 from shared.document import Document
 from shared.storage  import S3Uri
 from shared.bus      import Bus
@@ -18,18 +19,12 @@ from dotmap    import DotMap
 
 from utils     import TextractHelper
 
-def lambda_handler(event: Dict, context):
+def processDocument(document, publisher, helper):
     """
     Worker for converting output textract analyze-document identified 'TABLE' items to a new
     format usable by the user interface
-
-    Event format: shared.document.Document
-    }
     """
 
-    helper   = TextractHelper()
-
-    document = Document.from_dict(event)
     message  = ReshapeMapUpdates(DocumentID = document.DocumentID)
 
     Logger.info(f'{STAGE} Actor : Started Processing DocumentID = {document.DocumentID}')
@@ -59,7 +54,7 @@ def lambda_handler(event: Dict, context):
             f'{STAGE} Actor : Reshaped Results into Task-Input Format for Textract JobID = {document.ExtractMap.TextractID}'
         )
 
-        output_s3_uri.PutJSON(task_input)
+        output_s3_uri.PutJSON(task_input, encoding = 'gzip')
 
     except Exception as e:
 
@@ -74,10 +69,27 @@ def lambda_handler(event: Dict, context):
     message.MapUpdates.StageS3Uri = output_s3_uri
     message.FinalStamp            = GetCurrentStamp()
 
-    Bus.PutMessage(stage = STAGE, message_body = message.to_json())
+    publisher.PutMessage(message_body = message.to_json())
 
     Logger.info(f'{STAGE} Actor : Stopped Processing DocumentID = {document.DocumentID}')
 
+def lambda_handler(event, context):
+    """
+    Event format: a reference to a shared.document.Document, or the document itself, or several
+    of either under 'Documents'
+    """
+
+    helper = TextractHelper()
+
+    with Bus.Publisher(stage = STAGE) as publisher:
+
+        for document in Database.HydrateDocuments(event):
+
+            if  document:
+                processDocument(document, publisher, helper)
+
+    return None
+
 if  __name__ == '__main__':
 
     STAGE = Stage.RESHAPE
@@ -12,7 +12,7 @@ from shared.bus       import Bus
 
 def lambda_handler(event, context):
 
-    BeginProcessor(stage = STAGE, actor = STAGE_ACTOR, retryLimit = 30).process()
+    BeginProcessor(stage = STAGE, actor = STAGE_ACTOR, retryLimit = 30, batchSize = 10).process()
 
 if  __name__ == '__main__':
 
@@ -9,14 +9,28 @@ class TextractHelper:
 
     def get_result_from_s3(cls, textract_id: str, s3_bucket:str, s3_prefix: str) -> Dict:
 
-        from textractcaller.t_call import get_full_json_from_output_config, OutputConfig
+        from textractcaller.t_call import remove_none
+
+      # same result as textractcaller's get_full_json_from_output_config, with the numbered parts fetched concurrently
+        outputS3Uri = S3Uri(Bucket = s3_bucket.strip('/'), Prefix = f"{s3_prefix.strip('/')}/{textract_id}")
+        outputParts = {
+            uri.Key : part for uri, part in outputS3Uri.ListAndFetch(
+                key_predicate = lambda key : key.split('/')[-1].isnumeric(), reader = S3Uri.GetJSON
+            )
+        }
 
-        textract_response = get_full_json_from_output_config(OutputConfig(s3_bucket = s3_bucket,
-                                                                          s3_prefix = s3_prefix),
-                                                                          job_id    = textract_id,
-                                                                          s3_client = S3Client)
+        textract_response = {}
 
-        return textract_response
+        for key in sorted(outputParts, key = lambda key : int(key.split('/')[-1])):
+
+            if  'Blocks' in textract_response:
+                textract_response['Blocks'].extend(outputParts[key]['Blocks'])
+            else:
+                textract_response = dict(outputParts[key])
+
+        textract_response.pop('NextToken', None)
+
+        return remove_none(textract_response)
 
     def get_result_from_api(cls, textract_id) -> Dict:
 
@@ -5,21 +5,82 @@ from shared.defines import *
 from shared.loggers import Logger
 from shared.clients import LambdaClient
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing             import Iterable, Iterator, Tuple
+
 class Action:
 
+    MAX_WORKERS = 16 # concurrent invocations of a fan-out
+
     @staticmethod
     def Invoke(function_name, payload_bytes = b''):
 
         print(f'Action Invoking Function = {function_name}')
 
-        response = LambdaClient.invoke(
-            FunctionName   = function_name,
-            Payload        = payload_bytes,
-            InvocationType = 'Event' # expecting StatusCode of 202 for Event type
-        )
+        try:
+
+            response = LambdaClient.invoke(
+                FunctionName   = function_name,
+                Payload        = payload_bytes,
+                InvocationType = 'Event' # expecting StatusCode of 202 for Event type
+            )
+
+        except LambdaClient.exceptions.TooManyRequestsException as e:
+
+            Logger.info(f'Action Throttled Invoking Function = {function_name} : exception = {e}')
+
+            return BUSY
 
         if  response['StatusCode'] != 202:
             Logger.pretty(response)
 
         return PASS if response['StatusCode'] == 202 else \
                FAIL
+
+    @staticmethod
+    def InvokeMany(function_name, payloads: Iterable[Tuple[str, bytes]], max_workers: int = None) -> Iterator[Tuple[str, str]]:
+        """
+        Invoke a function once per (key, payload_bytes) concurrently, yielding (key, outcome) as each settles.
+        The first BUSY outcome stops further invocations, the ones in flight still settle and are yielded,
+        while the remaining payloads are left alone.
+        """
+
+        max_workers = max_workers or Action.MAX_WORKERS
+        payloads    = iter(payloads)
+        throttled   = False
+
+        with ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'action') as executor:
+
+            inflight = {}
+
+            while True:
+
+                while not throttled and len(inflight) < max_workers:
+
+                    entry = next(payloads, None)
+
+                    if  entry is None:
+                        break
+
+                    key, payload_bytes = entry
+
+                    inflight[executor.submit(Action.Invoke, function_name, payload_bytes)] = key
+
+                if  not inflight:
+                    break
+
+                settled, _ = wait(inflight, return_when = FIRST_COMPLETED)
+
+                for future in settled:
+
+                    key = inflight.pop(future)
+
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        Logger.error(f'Action Failed Invoking Function = {function_name} : exception = {e}')
+                        outcome = FAIL
+
+                    throttled = throttled or outcome == BUSY
+
+                    yield key, outcome
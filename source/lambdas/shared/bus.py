@@ -4,14 +4,39 @@
 from shared.defines import *
 from shared.environ import *
 from shared.loggers import Logger
-from shared.clients import SQSResource, ServiceResource
+from shared.clients import SQSClient, S3Client
+from shared.storage import S3Uri
 
+from botocore.exceptions import ClientError
+
+from base64    import b64decode, b64encode
+from gzip      import compress, decompress
+from random    import random
+from uuid      import uuid4
+from threading import Event, Lock, Thread
+from time      import monotonic, sleep
 
 class Bus:
 
-    Queue = {}
+    """
+    Stage event bus over SQS, through the low-level client as it is shared by consumer and heartbeat
+    threads, unlike the Queue resource
+    """
+
+    Queue = {} # stage → queue url
+
+    BATCH_LIMIT  = 10 # messages per receive and per delete request
+    WAIT_SECONDS = 5  # long poll, so an empty receive means an empty queue rather than an unlucky sample
+    EMPTY_LIMIT  = 2  # consecutive empty receives before the queue is taken as drained
+    TIME_BUDGET  = 60 # seconds spent receiving per call, in line with the pipeline standby
+    SIZE_LIMIT   = 256 * 1024 # bytes per message and per send request
+
+    COMPRESS_LIMIT = 64 * 1024 # bodies beyond this are gzipped, and offloaded to the store bucket when still beyond SIZE_LIMIT
+
+    VISIBILITY_SECONDS = 60 # visibility timeout a heartbeat renews on the messages it holds
+    HEARTBEAT_SECONDS  = 10 # period of the heartbeat, well within the queue default visibility of 30 seconds
 
-    def GetQueue(stage) -> ServiceResource:
+    def GetQueueUrl(stage) -> str:
 
         if  stage.lower() not in Bus.Queue:
 
@@ -19,56 +44,436 @@ class Bus:
 
             Logger.info(f'Bus : Getting Queue {queue_name} by Name')
 
-            Bus.Queue[stage.lower()] = SQSResource.get_queue_by_name(
+            Bus.Queue[stage.lower()] = SQSClient.get_queue_url(
                 QueueName = queue_name
-            )
+            )['QueueUrl']
 
         return Bus.Queue[stage.lower()]
 
     def GetMessages(stage = STAGE):
 
-        while True:
+        for messages in Bus.GetMessageBatches(stage = stage):
+            for message in messages:
+                yield message
 
-            response = Bus.GetQueue(stage).receive_messages(MaxNumberOfMessages = 10)
+    def GetMessageBatches(stage = STAGE, wait_seconds = None, empty_limit = None, time_budget = None):
 
-            for message in response:
-                yield message
+        """
+        Long poll the stage queue, yielding each non-empty batch of messages, until it stays empty for
+        empty_limit receives in a row or time_budget seconds have been spent
+        """
 
-            if  len(response) == 0:
+        wait_seconds = Bus.WAIT_SECONDS if wait_seconds is None else wait_seconds
+        empty_limit  = Bus.EMPTY_LIMIT  if empty_limit  is None else empty_limit
+        time_budget  = Bus.TIME_BUDGET  if time_budget  is None else time_budget
+
+        deadline = monotonic() + time_budget
+        empties  = 0
+
+        while empties < empty_limit:
+
+            remaining = deadline - monotonic()
+
+            if  remaining <= 0:
                 break
 
+            response = SQSClient.receive_message(
+                QueueUrl              = Bus.GetQueueUrl(stage),
+                MaxNumberOfMessages   = Bus.BATCH_LIMIT,
+                MessageAttributeNames = ['All'],
+                WaitTimeSeconds       = min(wait_seconds, int(remaining))
+            ).get('Messages', [])
+
+            if  len(response) == 0:
+                empties += 1
+                continue
+
+            empties = 0
+            decoded = Bus.DecodeMessages(stage, [ReceivedMessage(message) for message in response])
+
+            if  decoded:
+                yield decoded
+
+    def DecodeMessages(stage = STAGE, messages = []):
+
+        """
+        Decode received messages one by one, so that a message failing to decode does not hold up the
+        others. A message whose claim check is gone, i.e. a redelivery of one already handled, is deleted,
+        any other failure is left to be delivered again
+        """
+
+        decoded = []
+        claimed = []
+
+        for message in messages:
+
+            try:
+
+                decoded.append(Bus.Decode(message))
+
+            except ClientError as e:
+
+                if  e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                    Logger.error(f'Bus : Decode Failed for Message Id = {message.message_id} : exception = {e}')
+                    continue
+
+                Logger.error(f'Bus : Claim Gone for Message Id = {message.message_id}, Deleting Message')
+
+                claimed.append(message)
+
+            except Exception as e:
+
+                Logger.error(f'Bus : Decode Failed for Message Id = {message.message_id} : exception = {e}')
+
+        if  claimed:
+            Bus.DelMessages(
+                stage           = stage,
+                receipt_handles = [{'Id' : str(n), 'ReceiptHandle' : message.receipt_handle} for n, message in enumerate(claimed)]
+            )
+
+        return decoded
+
     def DelMessages(stage = STAGE, receipt_handles = []):
 
-        response = Bus.GetQueue(stage).delete_messages(Entries = receipt_handles)
+        response = SQSClient.delete_message_batch(QueueUrl = Bus.GetQueueUrl(stage), Entries = receipt_handles)
 
-        return PASS if response else FAIL
+        for failure in response.get('Failed', []):
+            Logger.error(f'Bus : Delete Failed for Message Id = {failure["Id"]} : {failure.get("Message")}')
+
+        return PASS if response and not response.get('Failed') else FAIL
+
+    def Acknowledger(stage = STAGE, heartbeat = None):
+
+        return MessageAcknowledger(stage = stage, heartbeat = heartbeat)
+
+    def Heartbeat(stage = STAGE):
+
+        return MessageHeartbeat(stage = stage)
 
     def PutMessage(stage = STAGE, message_body = '', message_attributes = {}):
 
-        response = Bus.GetQueue(stage).send_message(
+        message_body, message_attributes = Bus.Encode(stage, message_body, message_attributes)
+
+        response = SQSClient.send_message(
+            QueueUrl          = Bus.GetQueueUrl(stage),
             MessageBody       = message_body,
             MessageAttributes = message_attributes
         )
 
         return PASS if response else FAIL
 
+    def MessageSize(message_body = '', message_attributes = {}):
+
+        return len(message_body.encode()) + sum(
+            len(name.encode()) + len(value['DataType'].encode()) +
+            len((value.get('StringValue') or '').encode()) + len(value.get('BinaryValue') or b'')
+            for name, value in message_attributes.items()
+        )
+
+    def Encode(stage = STAGE, message_body = '', message_attributes = {}):
+
+        """
+        Fit a message body within the queue limits, gzipping a large one and, when that is not enough,
+        storing it in the store bucket and sending its location instead (claim check)
+        """
+
+        if  len(message_body.encode()) <= Bus.COMPRESS_LIMIT:
+            return message_body, message_attributes
+
+        packed     = compress(message_body.encode())
+        attributes = {**message_attributes, 'ContentEncoding' : {'DataType' : 'String', 'StringValue' : 'gzip'}}
+        body       = b64encode(packed).decode()
+
+        if  Bus.MessageSize(body, attributes) > Bus.SIZE_LIMIT:
+
+            location = S3Uri(Bucket = STORE_BUCKET, Object = f'bus/{stage}/{uuid4().hex}.json.gz'.lower())
+            location.Put(packed, contentType = 'application/json')
+
+            attributes['ContentLocation'] = {'DataType' : 'String', 'StringValue' : location.Url}
+            body                          = location.Url
+
+        return body, attributes
+
+    def Decode(message):
+
+        """
+        Restore the body of a received message sent through Encode, in place
+        """
+
+        attributes = message.message_attributes or {}
+        encoding   = attributes.get('ContentEncoding', {}).get('StringValue')
+        location   = attributes.get('ContentLocation', {}).get('StringValue')
+
+        if  not encoding and not location:
+            return message
+
+        body = S3Uri.FromUrl(location).Get() if location else b64decode(message.body)
+
+        if  encoding == 'gzip':
+            body = decompress(body)
+
+        message.body = body.decode()
+
+        return message
+
+    def Publisher(stage = STAGE):
+
+        return MessagePublisher(stage = stage)
+
     def Purge(stage = STAGE):
 
         try:
-        
-            Bus.GetQueue(stage).purge()
+
+            SQSClient.purge_queue(QueueUrl = Bus.GetQueueUrl(stage))
 
         except:
 
-            for message in Bus.GetMessages(stage = stage):
-                message.delete()
+            with Bus.Acknowledger(stage = stage) as acknowledger:
+                for message in Bus.GetMessages(stage = stage):
+                    acknowledger.Acknowledge(message)
+
+class ReceivedMessage:
+
+    """
+    A message as received through the client, read through the same attributes as a Queue resource message
+    """
+
+    def __init__(self, message):
+
+        self.message_id         = message.get('MessageId')
+        self.receipt_handle     = message['ReceiptHandle']
+        self.body               = message['Body']
+        self.message_attributes = message.get('MessageAttributes')
+
+class MessageAcknowledger:
+
+    """
+    Collects received messages once they are handled and deletes them from the queue in batches,
+    releasing them from the heartbeat that keeps them invisible, if any
+    """
+
+    def __init__(self, stage = STAGE, heartbeat = None):
+
+        self.stage     = stage
+        self.heartbeat = heartbeat
+        self.Pending   = []
+
+    def __len__(self):
+
+        return len(self.Pending)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.Flush()
+
+    def Acknowledge(self, message):
+
+        self.Pending.append(message)
+
+        if  len(self.Pending) >= Bus.BATCH_LIMIT:
+            self.Flush()
+
+    def Flush(self):
+
+        while self.Pending:
+
+            batch, self.Pending = self.Pending[:Bus.BATCH_LIMIT], self.Pending[Bus.BATCH_LIMIT:]
+
+            outcome = Bus.DelMessages(
+                stage           = self.stage,
+                receipt_handles = [
+                    {'Id' : str(n), 'ReceiptHandle' : message.receipt_handle} for n, message in enumerate(batch)
+                ]
+            )
+
+            if  self.heartbeat:
+                self.heartbeat.Release(batch)
+
+            if  outcome == PASS:
+                self.DropClaims(batch)
+
+    def DropClaims(self, messages):
+
+        """
+        Remove the stored bodies of offloaded messages once these are deleted
+        """
+
+        claims = {}
+
+        for message in messages:
+
+            location = (message.message_attributes or {}).get('ContentLocation', {}).get('StringValue')
+
+            if  location:
+                claim = S3Uri.FromUrl(location)
+                claims.setdefault(claim.Bucket, []).append({'Key' : claim.Key})
+
+        for bucket, keys in claims.items():
+            S3Client.delete_objects(Bucket = bucket, Delete = {'Objects' : keys, 'Quiet' : True})
+
+class MessageHeartbeat:
+
+    """
+    Keeps received messages invisible on the queue while they are being handled, renewing their
+    visibility timeout from a background thread until they are released
+    """
+
+    def __init__(self, stage = STAGE):
+
+        self.stage   = stage
+        self.Held    = {}
+        self.lock    = Lock()
+        self.stopped = Event()
+        self.thread  = Thread(target = self.Run, name = f'heartbeat-{stage}', daemon = True)
+
+    def __len__(self):
+
+        return len(self.Held)
+
+    def __enter__(self):
+
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.stopped.set()
+        self.thread.join()
+
+    def Hold(self, messages):
+
+        with self.lock:
+            self.Held.update({message.receipt_handle : message for message in messages})
+
+    def Release(self, messages):
+
+        with self.lock:
+            for message in messages:
+                self.Held.pop(message.receipt_handle, None)
+
+    def Run(self):
+
+        while not self.stopped.wait(Bus.HEARTBEAT_SECONDS):
+            self.Beat()
+
+    def Beat(self):
+
+        with self.lock:
+            handles = list(self.Held)
+
+        for n in range(0, len(handles), Bus.BATCH_LIMIT):
+
+            try:
+
+                response = SQSClient.change_message_visibility_batch(
+                    QueueUrl = Bus.GetQueueUrl(self.stage),
+                    Entries  = [
+                        {'Id' : str(i), 'ReceiptHandle' : handle, 'VisibilityTimeout' : Bus.VISIBILITY_SECONDS}
+                        for i, handle in enumerate(handles[n : n + Bus.BATCH_LIMIT])
+                    ]
+                )
+
+                for failure in response.get('Failed', []):
+                    Logger.error(f'Bus : Heartbeat Failed for Message Id = {failure["Id"]} : {failure.get("Message")}')
+
+            except Exception as e:
+
+                Logger.error(f'Bus : Heartbeat Failed : exception = {e}')
+
+class MessagePublisher:
+
+    """
+    Buffers outgoing messages and sends them in batches of up to ten entries and SIZE_LIMIT bytes,
+    retrying only the entries a batch reports as failed
+    """
+
+    RETRY_LIMIT = 8
+    RETRY_DELAY = 0.05
+
+    def __init__(self, stage = STAGE):
+
+        self.stage   = stage
+        self.Pending = []
+        self.Size    = 0
+        self.Count   = 0
+        self.Failed  = 0
+
+    def __len__(self):
+
+        return len(self.Pending)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.Flush()
+
+    def PutMessage(self, message_body = '', message_attributes = {}):
+
+        message_body, message_attributes = Bus.Encode(self.stage, message_body, message_attributes)
+
+        entry = {'Id' : str(self.Count), 'MessageBody' : message_body}
+
+        if  message_attributes:
+            entry['MessageAttributes'] = message_attributes
+
+        size = Bus.MessageSize(message_body, message_attributes)
+
+        if  len(self.Pending) >= Bus.BATCH_LIMIT or self.Size + size > Bus.SIZE_LIMIT:
+            self.Flush()
+
+        self.Pending.append(entry)
+        self.Size  += size
+        self.Count += 1
+
+    def Flush(self):
+
+        if  self.Pending:
+            self.SendBatch(self.Pending)
+
+        self.Pending = []
+        self.Size    = 0
+
+    def SendBatch(self, entries):
+
+        for attempt in range(MessagePublisher.RETRY_LIMIT):
+
+            response = SQSClient.send_message_batch(QueueUrl = Bus.GetQueueUrl(self.stage), Entries = entries)
+            failures = response.get('Failed', [])
+
+            for failure in failures:
+                if  failure.get('SenderFault'):
+                    Logger.error(f'Bus : Send Rejected for Message Id = {failure["Id"]} : {failure.get("Message")}')
+
+            retry   = {failure['Id'] for failure in failures if not failure.get('SenderFault')}
+            entries = [entry for entry in entries if entry['Id'] in retry]
+
+            self.Failed += len(failures) - len(retry)
+
+            if  not entries:
+                return
+
+            sleep(MessagePublisher.RETRY_DELAY * 2 ** attempt * random())
+
+        Logger.error(f'Bus : Send Failed for {len(entries)} Messages after {MessagePublisher.RETRY_LIMIT} Attempts')
+
+        self.Failed += len(entries)
 
 if  __name__ == '__main__':
 
-    for message in Bus.GetMessages(stage = STAGE):
-        message.delete()
+    with Bus.Acknowledger(stage = STAGE) as acknowledger:
+        for message in Bus.GetMessages(stage = STAGE):
+            acknowledger.Acknowledge(message)
 
-    for n in range(20):
-        Bus.PutMessage(
-            stage = STAGE, message_body = dumps({'DocumentID': f'{n:03d}', 'Status': PASS})
-        )
+    with Bus.Publisher(stage = STAGE) as publisher:
+        for n in range(20):
+            publisher.PutMessage(
+                message_body = dumps({'DocumentID': f'{n:03d}', 'Status': PASS})
+            )
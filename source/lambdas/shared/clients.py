@@ -1,9 +1,70 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-from boto3                     import resource, client
+from boto3.session             import Session
 from boto3.dynamodb.conditions import Key
 from boto3.resources.base      import ServiceResource
+from botocore.config           import Config
+from threading                 import Lock
+
+CONFIG = Config(
+    max_pool_connections = 50, # room for the concurrent fan-outs, queries and drains
+    retries              = {'mode' : 'adaptive', 'max_attempts' : 10},
+    tcp_keepalive        = True,
+)
+
+class Clients:
+    """
+    Per-process session, and the clients and resources made from it, each created on first use
+    """
+
+    Session = None
+    Created = {}
+    Guard   = Lock() # sessions are not safe to create clients from in several threads at once
+
+    @staticmethod
+    def Get(kind, service):
+
+        if  (kind, service) not in Clients.Created:
+
+            with Clients.Guard:
+
+                if  Clients.Session is None:
+                    Clients.Session = Session()
+
+                if  (kind, service) not in Clients.Created:
+
+                    factory = Clients.Session.client if kind == 'client' else Clients.Session.resource
+
+                    Clients.Created[(kind, service)] = factory(service, config = CONFIG)
+
+        return Clients.Created[(kind, service)]
+
+class Lazy:
+    """
+    Stands in for a client or resource, which is only created when first used
+    """
+
+    def __init__(self, kind, service):
+
+        self.__dict__['kind']    = kind
+        self.__dict__['service'] = service
+
+    def __getattr__(self, name):
+
+        return getattr(Clients.Get(self.kind, self.service), name)
+
+    def __repr__(self):
+
+        return f'Lazy({self.kind}, {self.service})'
+
+def resource(service):
+
+    return Lazy('resource', service)
+
+def client(service):
+
+    return Lazy('client', service)
 
 DynamoDBResource    = resource('dynamodb')
 CloudWatchResource  = resource('cloudwatch')
@@ -1,12 +1,21 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types      import TypeDeserializer, TypeSerializer
+from concurrent.futures        import ThreadPoolExecutor
+from heapq                     import merge
+from queue                     import Queue
+from random                    import random
+from threading                 import Event
+from time                      import sleep
+from zlib                      import crc32
+from typing                    import Callable, Iterator
 
 from shared.defines import *
 from shared.environ import *
 from shared.loggers import Logger
-from shared.clients import DynamoDBResource, Key
+from shared.clients import DynamoDBResource, DynamoDBClient, Key, CONFIG
 
 from shared.document import Document
 
@@ -17,8 +26,22 @@ class Database:
 
     Table = DynamoDBResource.Table(TABLE_PIPELINE)
 
+    Serializer   = TypeSerializer()
+    Deserializer = TypeDeserializer()
+
+    BATCH_GET_LIMIT = 100
+    QUERY_WORKERS   = CONFIG.max_pool_connections # keys queried at once, the rest queue up for a free worker
+
     Logger.info(f'Database Connecting! : DynamoDB Resource is {TABLE_PIPELINE}')
 
+    @staticmethod
+    def Deserialize(item: Dict) -> Dict:
+        """
+        Convert an item in DynamoDB JSON, as returned by the client and by streams, to plain python values
+        """
+
+        return {key : Database.Deserializer.deserialize(value) for key, value in item.items()}
+
     @staticmethod
     def GetDocument(document_id: str) -> Document:
         """
@@ -47,53 +70,625 @@ class Database:
             return None
 
     @staticmethod
-    def GetDocuments(stages: List[Stage], states: List[State]) -> List[Document]:
+    def Reference(document: Document) -> Dict:
+        """
+        Reference to a document, carrying the StageState it is expected to be in, for payloads that
+        should not carry the document itself
+        """
+
+        return {'DocumentID' : document.DocumentID, 'StageState' : document.StageState}
+
+    @staticmethod
+    def HydrateDocuments(event: Dict) -> List[Document]:
+        """
+        Documents an actor event refers to, either a single one or several under 'Documents', in order.
+        References are resolved against the table in one round trip, with None in place of documents
+        that have since moved on from their expected StageState. The read is strongly consistent, as it
+        follows right after Begin claimed the documents
+        """
+
+        entries    = event['Documents'] if 'Documents' in event else [event]
+        references = [entry for entry in entries if not set(entry) - {'DocumentID', 'StageState'}]
+        stored     = Database.GetDocumentsByIds([entry['DocumentID'] for entry in references], consistent = True) if references else {}
+        documents  = []
+
+        for entry in entries:
+
+            if  set(entry) - {'DocumentID', 'StageState'}:
+                documents.append(Document.from_dict(entry))
+                continue
+
+            document = stored.get(entry['DocumentID'].lower())
+
+            if  not document or entry.get('StageState', document.StageState) != document.StageState:
+
+                Logger.info(
+                    f'Database HydrateDocuments : DocumentID = {entry["DocumentID"]} is no longer in {entry.get("StageState")}'
+                )
+
+                document = None
+
+            documents.append(document)
+
+        return documents
+
+    @staticmethod
+    def GetDocumentsByIds(document_ids: List[str], consistent: bool = False) -> Dict[str, Document]:
         """
-        Fetch a specific document set
+        Fetch a set of documents by id through BatchGetItem, 100 keys per request,
+        resubmitting unprocessed keys with jittered exponential backoff.
+        When consistent, the read reflects every write acknowledged before it.
         """
 
-        for stage in stages:
-            for state in states:
+        document_ids = list(dict.fromkeys(document_id.lower() for document_id in document_ids)) # a request may not repeat a key
+        documents    = {}
+
+        for n in range(0, len(document_ids), Database.BATCH_GET_LIMIT):
+
+            keys = [{'DocumentID' : {'S' : document_id}} for document_id in document_ids[n:n + Database.BATCH_GET_LIMIT]]
+
+            for attempt in range(DocumentWriter.RETRY_LIMIT + 1):
+
+                if  attempt:
+                    sleep(DocumentWriter.RETRY_DELAY * (2 ** attempt) * random())
+
+                response = DynamoDBClient.batch_get_item(RequestItems = {TABLE_PIPELINE : {'Keys' : keys, 'ConsistentRead' : consistent}})
+
+                for item in response.get('Responses', {}).get(TABLE_PIPELINE, []):
+
+                    document = Document.from_dict(Database.Deserialize(item))
+
+                    documents[document.DocumentID] = document
 
-                response = Database.Table.query(
-                    IndexName              = INDEX_PROGRESS,
-                    KeyConditionExpression = Key('StageState').eq(f'{stage}{HASH}{state}'.title())
+                keys = response.get('UnprocessedKeys', {}).get(TABLE_PIPELINE, {}).get('Keys', [])
+
+                if  not keys:
+                    break
+
+            if  keys:
+                Logger.error(
+                    f'Database GetDocumentsByIds : Unprocessed DocumentIDs = {[key["DocumentID"]["S"] for key in keys]}'
                 )
 
-                for item in response['Items']:
-                    yield Document.from_dict(item)
-        return []
+        return documents
+
+    @staticmethod
+    def GetDocuments(stages: List[Stage], states: List[State], page_size: int = None, limit: int = None,
+                     projection: List[str] = None, ordered: bool = False) -> Iterator[Document]:
+        """
+        Fetch a specific document set.
+        With a projection (attribute paths such as 'ExtractMap.StartStamp') only those attributes are read,
+        and the documents returned are partial views which may be written through UpdateDocument only.
+        When ordered, documents come by OrderStamp (Order, most urgent i.e. lowest first, then Stamp) across all keys.
+        """
+
+        stage_states = [stage_state for stage in stages for state in states for stage_state in Database.StageStates(stage, state)]
+
+        query = Database.QueryOrdered if ordered else Database.QueryProgress
+
+        for item in query(stage_states, page_size = page_size, limit = limit, projection = projection):
+            yield Document.from_dict(item, partial = bool(projection))
+
+    @staticmethod
+    def StageStates(stage: Stage, state: State) -> List[str]:
+        """
+        Progress index keys holding documents in a stage and state: the unsharded key, plus one per write shard
+        """
+
+        stage_state = f'{stage}{HASH}{state}'.title()
+
+        return [stage_state] + [f'{stage_state}{HASH}{n}' for n in range(SHARDS if SHARDS > 1 else 0)]
+
+    @staticmethod
+    def ShardOf(document_id: str) -> int:
+        """
+        Stable write shard for a document, None when the progress index is unsharded
+        """
+
+        return crc32(document_id.lower().encode()) % SHARDS if SHARDS > 1 else None
+
+    @staticmethod
+    def QueryProgress(stage_states: List[str], page_size: int = None, limit: int = None,
+                      projection: List[str] = None) -> Iterator[Dict]:
+        """
+        Query the progress index for several StageState keys at once, one worker per key up to QUERY_WORKERS,
+        yielding items from whichever page arrives first until every key is exhausted or limit is reached
+        """
+
+        if  not stage_states:
+            return
+
+        pages  = Queue()
+        halted = Event()
+
+        def worker(stage_state):
+
+            try:
+                if  halted.is_set():
+                    return # queued behind the workers, and no longer needed
+
+                for page in Database.QueryPages(stage_state, page_size = page_size, limit = limit, projection = projection):
+
+                    pages.put(page)
+
+                    if  halted.is_set():
+                        break
+
+            except Exception as e:
+                pages.put(e)
+
+            finally:
+                pages.put(None)
+
+        executor = ThreadPoolExecutor(max_workers = min(len(stage_states), Database.QUERY_WORKERS), thread_name_prefix = 'progress')
+
+        for stage_state in stage_states:
+            executor.submit(worker, stage_state)
+
+        active = len(stage_states)
+        count  = 0
+
+        try:
+            while active:
+
+                page = pages.get()
+
+                if  page is None:
+                    active -= 1
+                    continue
+
+                if  isinstance(page, Exception):
+                    raise page
+
+                for item in page:
+
+                    yield Database.Deserialize(item)
+
+                    count += 1
+
+                    if  limit and count >= limit:
+                        return
+        finally:
+            halted.set()
+            executor.shutdown(wait = False)
+
+    @staticmethod
+    def QueryOrdered(stage_states: List[str], page_size: int = None, limit: int = None,
+                     projection: List[str] = None) -> Iterator[Dict]:
+        """
+        Query the progress index for several StageState keys at once and merge them by OrderStamp,
+        the sort key of the index, so that every key is already in order and only its head is needed
+        """
+
+        if  not stage_states:
+            return
+
+        if  projection and 'OrderStamp' not in projection:
+            projection = [*projection, 'OrderStamp']
+
+        def fetch(stage_state):
+            return [item for page in Database.QueryPages(stage_state, page_size = page_size, limit = limit, projection = projection) for item in page]
+
+        with ThreadPoolExecutor(max_workers = min(len(stage_states), Database.QUERY_WORKERS), thread_name_prefix = 'progress') as executor:
+            streams = list(executor.map(fetch, stage_states))
+
+        for count, item in enumerate(merge(*streams, key = lambda item: Database.OrderKey(item['OrderStamp']['S'])), start = 1):
+
+            yield Database.Deserialize(item)
+
+            if  limit and count >= limit:
+                return
+
+    @staticmethod
+    def OrderKey(order_stamp: str) -> str:
+        """
+        OrderStamp as compared by QueryOrdered, padding the Order of documents stored before Orders were
+        zero-padded, so that text order is priority order for every row
+        """
+
+        order, _, stamp = order_stamp.partition(HASH)
+
+        return f'{order.zfill(ORDER_WIDTH) if order.isdigit() else order}{HASH}{stamp}'
+
+    @staticmethod
+    def QueryPages(stage_state: str, page_size: int = None, limit: int = None,
+                   projection: List[str] = None) -> Iterator[List[Dict]]:
+        """
+        Page through a single StageState key of the progress index, following LastEvaluatedKey
+        (uses the low-level client as it is shared across worker threads, unlike the Table resource)
+        """
+
+        pagination = {}
+        projecting = {}
+
+        if  projection:
+
+            names = {f'#{name}' : name for path in projection for name in path.split('.')}
+
+            projecting['ProjectionExpression']     = ', '.join('.'.join(f'#{name}' for name in path.split('.')) for path in projection)
+            projecting['ExpressionAttributeNames'] = names
+
+        if  page_size:
+            pagination['PageSize'] = page_size
+
+        if  limit:
+            pagination['MaxItems'] = limit
+
+        paginator = DynamoDBClient.get_paginator('query')
+
+        for page in paginator.paginate(
+            TableName                 = TABLE_PIPELINE,
+            IndexName                 = INDEX_PROGRESS,
+            KeyConditionExpression    = 'StageState = :StageState',
+            ExpressionAttributeValues = {':StageState' : {'S' : stage_state}},
+            PaginationConfig          = pagination,
+            **projecting
+        ):
+            yield page['Items']
 
     @staticmethod
     def PutDocument(document: Document) -> Document:
         """
-        Update a specific document
+        Update a specific document, provided no other writer has moved its StageState on since it was read
         """
+        Database.AssertComplete(document)
+
         document.DocID = document.DocID.lower()
-        
-        response = Database.Table.put_item(Item = document.to_dict())
+
+        condition = {}
+
+        if  document.PriorStageState:
+            condition['ConditionExpression'] = Attr('StageState').eq(document.PriorStageState)
+
+        try:
+            response = Database.Table.put_item(Item = document.to_dict(), **condition)
+
+        except Database.Table.meta.client.exceptions.ConditionalCheckFailedException:
+
+            Logger.info(
+                f'Database.PutDocument : DocumentID = {document.DocumentID}, Skipped as StageState is no longer {document.PriorStageState}'
+            )
+
+            return RACE
 
         Logger.info(
             f'Database.PutDocument : DocumentID = {document.DocumentID}'
         )
 
+        document.clean()
+
         return PASS if response['ResponseMetadata']['HTTPStatusCode'] == 200 else \
                FAIL
 
+    @staticmethod
+    def UpdateDocument(document: Document) -> str:
+        """
+        Update only the attributes of a specific document changed since it was read,
+        provided no other writer has moved its StageState on in the meantime
+        """
+
+        document.DocID = document.DocID.lower()
+
+        request = Database.UpdateRequest(document)
+
+        if  not request:
+            return SKIP
+
+        try:
+            response = DynamoDBClient.update_item(**request)
+
+        except DynamoDBClient.exceptions.ConditionalCheckFailedException:
+
+            Logger.info(
+                f'Database.UpdateDocument : DocumentID = {document.DocumentID}, Skipped as StageState is no longer {document.PriorStageState}'
+            )
+
+            return RACE
+
+        Logger.info(
+            f'Database.UpdateDocument : DocumentID = {document.DocumentID}, Changes = {request["UpdateExpression"]}'
+        )
+
+        document.clean()
+
+        return PASS if response['ResponseMetadata']['HTTPStatusCode'] == 200 else \
+               FAIL
+
+    @staticmethod
+    def AssertComplete(document: Document):
+        """
+        Refuse to write a partial document view as a whole item, which would erase the attributes it was not read with
+        """
+
+        if  document.Partial:
+            raise Exception(f'Database : DocumentID = {document.DocumentID} was read with a projection, write it with UpdateDocument')
+
+    @staticmethod
+    def UpdateRequest(document: Document) -> Dict:
+        """
+        Build a minimal UpdateItem request from the changed attribute paths of a document
+        """
+
+        changes = document.changes()
+
+        changes.pop('DocumentID', None) # key attribute, never updated
+
+        if  not changes:
+            return None
+
+        names       = {}
+        values      = {}
+        assignments = []
+
+        for n, (path, value) in enumerate(changes.items()):
+
+            aliases = []
+
+            for name in path.split('.'):
+                names[f'#{name}'] = name
+                aliases.append(f'#{name}')
+
+            values[f':v{n}'] = Database.Serializer.serialize(value)
+
+            assignments.append(f'{".".join(aliases)} = :v{n}')
+
+        request = {
+            'TableName'                 : TABLE_PIPELINE,
+            'Key'                       : {'DocumentID' : {'S' : document.DocumentID}},
+            'UpdateExpression'          : f'SET {", ".join(assignments)}',
+            'ExpressionAttributeNames'  : names,
+            'ExpressionAttributeValues' : values,
+        }
+
+        if  document.PriorStageState:
+
+            names['#StageState'] = 'StageState'
+            values[':prior']     = {'S' : document.PriorStageState}
+
+            request['ConditionExpression'] = '#StageState = :prior'
+
+        return request
+
+    @staticmethod
+    def BatchWriter() -> 'DocumentWriter':
+        """
+        Buffered writer for many documents, flushed in batches and on context exit
+        """
+
+        return DocumentWriter()
+
     @staticmethod
     def PromoteDocument(currentStage: Stage, nextStage: Stage):
         """
         Promote documents in SUCCESS state from current stage to next stage WAITING state
         """
 
-        for documentToUpdate in Database.GetDocuments([currentStage], [State.SUCCESS]):
+        return Database.PromoteDocuments({currentStage : nextStage})[currentStage]
+
+    @staticmethod
+    def PromoteDocuments(transitions: Dict[Stage, Stage]) -> Dict[Stage, int]:
+        """
+        Promote documents in SUCCESS state of every stage in transitions to the WAITING state of the next stage,
+        querying all stages at once and writing in batches. Returns the number promoted per stage.
+        """
+
+        stages = {}
+
+        with Database.BatchWriter() as writer:
+
+            for documentToUpdate in Database.GetDocuments(list(transitions), [State.SUCCESS], projection = ['DocumentID', 'StageState']):
+
+                currentStage = documentToUpdate.Stage.lower()
+                nextStage    = transitions[currentStage]
+
+                Logger.info(f'Moving {documentToUpdate.DocumentID} stage to {nextStage}')
+
+                documentToUpdate.Stage = nextStage
+                documentToUpdate.State = State.WAITING
+
+                stages[documentToUpdate.DocumentID.lower()] = currentStage
+
+                writer.UpdateDocument(documentToUpdate)
+
+        promoted = {stage : 0 for stage in transitions}
+
+        for document_id, stage in stages.items():
+            if  writer.Outcomes.get(document_id) == PASS:
+                promoted[stage] += 1
+
+        return promoted
+
+    @staticmethod
+    def AnyDocuments(stages: List[Stage], states: List[State]) -> bool:
+        """
+        Whether any document is in one of the given stages and states
+        """
+
+        for _ in Database.GetDocuments(stages, states, limit = 1, projection = ['DocumentID']):
+            return True
+
+        return False
+
+class DocumentWriter:
+    """
+    Buffers document writes and flushes them once 25 have been collected or on context exit.
+    Puts of new documents go through BatchWriteItem, with unprocessed items resubmitted under jittered exponential backoff.
+    Updates carry only changed attributes, which BatchWriteItem cannot express, so they are sent as
+    concurrent UpdateItem requests instead.
+    Callbacks registered with a document run only once its write has been settled, i.e. committed or
+    skipped because a concurrent writer had already moved the document on (see Outcomes).
+    """
+
+    BATCH_LIMIT = 25
+    RETRY_LIMIT = 8
+    RETRY_DELAY = 0.05 # seconds, doubled on every retry
 
-            Logger.info(f'Moving {documentToUpdate} stage to {nextStage}')
+    def __init__(self):
 
-            documentToUpdate.Stage = nextStage
-            documentToUpdate.State = State.WAITING
+        self.Pending  = {} # DocumentID → (item,     [callbacks])
+        self.Updates  = {} # DocumentID → (document, [callbacks])
+        self.Outcomes = {} # DocumentID → PASS | FAIL | SKIP | RACE
+
+    def __len__(self):
+
+        return len(self.Pending) + len(self.Updates)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.Flush()
+
+    def PutDocument(self, document: Document, on_commit: Callable = None):
+        """
+        Queue a document for writing, flushing when a full batch has been collected.
+        A document read from the table is updated instead, as BatchWriteItem cannot carry the condition
+        on its prior StageState
+        """
+
+        Database.AssertComplete(document)
+
+        if  document.PriorStageState:
+            return self.UpdateDocument(document, on_commit = on_commit)
+
+        document.DocID = document.DocID.lower()
+
+      # a batch may not hold two requests for one key, so a later put replaces the earlier one
+        _, callbacks = self.Pending.pop(document.DocumentID, (None, []))
+
+        if  on_commit:
+            callbacks.append(on_commit)
+
+        self.Pending[document.DocumentID] = (document.to_dict(), callbacks)
+
+        document.clean()
+
+        if  len(self) >= DocumentWriter.BATCH_LIMIT:
+            return self.Flush()
+
+        return PASS
+
+    def UpdateDocument(self, document: Document, on_commit: Callable = None):
+        """
+        Queue the changed attributes of a document for writing, flushing when a full batch has been collected
+        """
+
+        document.DocID = document.DocID.lower()
+
+        _, callbacks = self.Updates.pop(document.DocumentID, (None, []))
+
+        if  on_commit:
+            callbacks.append(on_commit)
+
+        self.Updates[document.DocumentID] = (document, callbacks)
+
+        if  len(self) >= DocumentWriter.BATCH_LIMIT:
+            return self.Flush()
+
+        return PASS
+
+    def Flush(self):
+        """
+        Write all buffered documents
+        """
+
+        outcome = PASS
+
+        if  self.Updates:
+
+            updates, self.Updates = self.Updates, {}
+
+            if  self.WriteUpdates(updates) == FAIL:
+                outcome = FAIL
+
+        while self.Pending:
+
+            batch = dict(list(self.Pending.items())[:DocumentWriter.BATCH_LIMIT])
+
+            for document_id in batch:
+                del self.Pending[document_id]
+
+            if  self.WriteBatch(batch) == FAIL:
+                outcome = FAIL
+
+        return outcome
+
+    def WriteBatch(self, batch: Dict) -> str:
+
+        requests = [{'PutRequest' : {'Item' : item}} for item, _ in batch.values()]
+
+        for attempt in range(DocumentWriter.RETRY_LIMIT + 1):
+
+            if  attempt:
+                sleep(DocumentWriter.RETRY_DELAY * (2 ** attempt) * random())
+
+            response = DynamoDBResource.batch_write_item(RequestItems = {TABLE_PIPELINE : requests})
+            requests = response.get('UnprocessedItems', {}).get(TABLE_PIPELINE, [])
+
+            if  not requests:
+                break
+
+        unprocessed = {request['PutRequest']['Item']['DocumentID'] for request in requests}
+
+        for document_id, (_, callbacks) in batch.items():
+
+            self.Outcomes[document_id] = FAIL if document_id in unprocessed else PASS
+
+            if  document_id in unprocessed:
+                continue
+
+            for callback in callbacks:
+                callback()
+
+        Logger.info(
+            f'Database.BatchWriter : Wrote {len(batch) - len(unprocessed)} of {len(batch)} Documents'
+        )
+
+        if  unprocessed:
+
+            Logger.error(
+                f'Database.BatchWriter : Unprocessed DocumentIDs = {sorted(unprocessed)}'
+            )
+
+            return FAIL
+
+        return PASS
+
+    def WriteUpdates(self, updates: Dict) -> str:
+
+        def update(document):
+
+            try:
+                return Database.UpdateDocument(document)
+
+            except Exception as e:
+
+                Logger.error(
+                    f'Database.BatchWriter : Update Failed for DocumentID = {document.DocumentID} : exception = {e}'
+                )
+
+                return FAIL
+
+        with ThreadPoolExecutor(max_workers = len(updates), thread_name_prefix = 'update') as executor:
+            outcomes = list(executor.map(update, [document for document, _ in updates.values()]))
+
+        for (document_id, (_, callbacks)), outcome in zip(updates.items(), outcomes):
+
+            self.Outcomes[document_id] = outcome
+
+            if  outcome == FAIL:
+                continue
+
+            for callback in callbacks:
+                callback()
+
+        Logger.info(
+            f'Database.BatchWriter : Updated {outcomes.count(PASS)} of {len(updates)} Documents, {outcomes.count(RACE)} Superseded'
+        )
 
-            Database.PutDocument(documentToUpdate)
+        return FAIL if FAIL in outcomes else PASS
 
 if __name__ == '__main__':
 
@@ -13,9 +13,13 @@ from        enum import Enum
 
 HASH = '#'
 
+ORDER_WIDTH = 4 # digits of a document Order, 0 the most urgent, zero-padded so that OrderStamp sorts as text
+
 PASS = 'pass'
 FAIL = 'fail'
 SKIP = 'skip'
+RACE = 'race' # conditional write lost to a concurrent writer
+BUSY = 'busy' # request throttled by the service, worth retrying later
 
 class Status:
     WAIT = 'wait'
@@ -42,6 +46,14 @@ class Stage:
     AUGMENT = 'augment'
     CATALOG = 'catalog'
 
+STAGE_TRANSITIONS_ORDER = [Stage.ACQUIRE,
+                           Stage.CONVERT,
+                           Stage.EXTRACT,
+                           Stage.RESHAPE,
+                           Stage.OPERATE,
+                           Stage.AUGMENT,
+                           Stage.CATALOG]
+
 class State:
     WAITING = 'waiting'
     RUNNING = 'running'
@@ -5,8 +5,8 @@ from shared.defines import *
 from shared.loggers import Logger
 from shared.storage import S3Uri
 
-from dataclasses import asdict, dataclass, fields, _MISSING_TYPE
-from typing      import Union, Any
+from dataclasses import asdict, dataclass, fields, is_dataclass, _MISSING_TYPE
+from typing      import Union, Any, Set
 from json        import JSONEncoder, loads
 
 class DocumentEncoder(JSONEncoder):
@@ -15,8 +15,41 @@ class DocumentEncoder(JSONEncoder):
             return int(o)
         return super(DocumentEncoder, self).default(o)
 
+class Tracked:
+    """
+    Records which dataclass fields have been assigned since the object was loaded or last written.
+    In-place mutation (e.g. list.append) is not seen, so reassign a field to have it recorded.
+    """
+
+    def __setattr__(self, name, value):
+
+        super().__setattr__(name, value)
+
+        if  name in self.__dataclass_fields__:
+            self.__dict__.setdefault('_changed', set()).add(name)
+
+    def changed(self) -> Set[str]:
+        return self.__dict__.get('_changed', set())
+
+    def clean(self):
+        self.__dict__['_changed'] = set()
+        return self
+
+def plain(value):
+    """
+    Convert an attribute value to the plain types stored in the database
+    """
+
+    if  is_dataclass(value):
+        return asdict(value)
+
+    if  isinstance(value, DotMap):
+        return value.toDict()
+
+    return value
+
 @dataclass
-class StageMap:
+class StageMap(Tracked):
 
     RetryCount: Decimal = 0
     StageS3Uri: S3Uri   = field(default_factory = S3Uri)
@@ -38,7 +71,7 @@ class StageMap:
             else:
                 setattr(stageMap, field, value)
 
-        return stageMap
+        return stageMap.clean()
 
 # region Stage Maps
 
@@ -73,7 +106,7 @@ class CatalogMap(StageMap):
 
 # endregion
 @dataclass
-class Document:
+class Document(Tracked):
     """
     Document Abstraction Object
     """
@@ -98,8 +131,8 @@ class Document:
 
     @Stage.setter
     def Stage(self, x):
-        _, y = self.StageState.split(HASH)
-        self.StageState = f'{x}{HASH}{y}'
+        _, y, *z = self.StageState.split(HASH)
+        self.StageState = HASH.join([x, y, *z])
 
     @property
     def State(self):
@@ -107,17 +140,37 @@ class Document:
 
     @State.setter
     def State(self, y):
-        x, _ = self.StageState.split(HASH)
-        self.StageState = f'{x}{HASH}{y}'.title()
+        x, _, *z = self.StageState.split(HASH)
+        self.StageState = HASH.join([x, y, *z]).title()
+
+    @property
+    def Shard(self):
+        """
+        Optional write shard of the progress index key, kept as a third StageState segment (e.g. 'Extract#Waiting#3')
+        """
+        x, y, *z = self.StageState.split(HASH)
+        return int(z[0]) if z else None
+
+    @Shard.setter
+    def Shard(self, n):
+        x, y, *_ = self.StageState.split(HASH)
+        self.StageState = HASH.join([x, y] if n is None else [x, y, str(n)])
 
     @property
     def Order(self):
+        """
+        Priority of the document, lower is more urgent, stored as ORDER_WIDTH digits (e.g. '0002' ahead of '0010')
+        """
         return self.OrderStamp.split(HASH)[0]
 
     @Order.setter
     def Order(self, x):
+
+        if  not str(x).isdigit() or int(x) >= 10 ** ORDER_WIDTH:
+            raise ValueError(f'Order must be a whole number from 0 to {10 ** ORDER_WIDTH - 1}, not {x!r}')
+
         _, y = self.OrderStamp.split(HASH)
-        self.OrderStamp = f'{x}{HASH}{y}'
+        self.OrderStamp = f'{int(x):0{ORDER_WIDTH}d}{HASH}{y}'
 
     @property
     def Stamp(self):
@@ -128,6 +181,13 @@ class Document:
         x, _ = self.OrderStamp.split(HASH)
         self.OrderStamp = f'{x}{HASH}{y}'
 
+    @property
+    def PriorStageState(self):
+        """
+        StageState as last read from or written to the database, None for a document never stored
+        """
+        return self.__dict__.get('_prior')
+
     @property
     def CurrentMap(self) -> StageMap:
         return getattr(self, f'{self.Stage.title()}Map')
@@ -140,10 +200,19 @@ class Document:
     def DocID(self, val):
         self.DocumentID = val
 
+    @property
+    def Partial(self):
+        """
+        True for a view read with a projection, holding only some of the stored attributes
+        """
+        return self.__dict__.get('_partial', False)
+
     @staticmethod
-    def from_dict(x):
+    def from_dict(x, partial = False):
         document = Document()
 
+        document.__dict__['_partial'] = partial
+
         for field, value in x.items():
             if (field in document.__dataclass_fields__ and
                 not isinstance(document.__dataclass_fields__[field].default_factory, _MISSING_TYPE)):
@@ -151,7 +220,7 @@ class Document:
             else:
                 setattr(document, field, value)
 
-        return document
+        return document.clean()
 
     @staticmethod
     def from_json(x):
@@ -163,6 +232,40 @@ class Document:
     def to_dict(self):
         return asdict(self)
 
+    def changes(self) -> Dict[str, Any]:
+        """
+        Attribute paths assigned since the document was loaded or last written, with their values.
+        A replaced StageMap is reported whole, otherwise only its assigned fields are (e.g. 'ExtractMap.TextractID').
+        """
+
+        changes = {}
+
+        for name in self.__dataclass_fields__:
+
+            value = getattr(self, name)
+
+            if  name in self.changed():
+                changes[name] = plain(value)
+
+            elif isinstance(value, StageMap):
+                for field in value.changed():
+                    changes[f'{name}.{field}'] = plain(getattr(value, field))
+
+        return changes
+
+    def clean(self):
+
+        for name in self.__dataclass_fields__:
+
+            value = getattr(self, name)
+
+            if  isinstance(value, StageMap):
+                value.clean()
+
+        self.__dict__['_prior'] = self.StageState
+
+        return super().clean()
+
 
 if  __name__ == '__main__':
 
@@ -7,10 +7,11 @@ from shared.helpers import GetEnvVar, GetAccount, GetRegion, GetPrefix, GetBranc
 
 if  'source' in __file__: # executing locally, mock environment variables
 
-    ACCOUNT = GetEnvVar('ACCOUNT', default = GetAccount()).lower()
-    REGION  = GetEnvVar( 'REGION', default =  GetRegion()).lower()
-    PREFIX  = GetEnvVar( 'PREFIX', default =  GetPrefix()).lower()
-    BRANCH  = GetEnvVar( 'BRANCH', default =  GetBranch()).lower()
+  # lookups only run for variables that are not set, and are cached across runs
+    ACCOUNT = GetEnvVar('ACCOUNT', default = GetAccount).lower()
+    REGION  = GetEnvVar( 'REGION', default =  GetRegion).lower()
+    PREFIX  = GetEnvVar( 'PREFIX', default =  GetPrefix).lower()
+    BRANCH  = GetEnvVar( 'BRANCH', default =  GetBranch).lower()
     STAGE   = GetEnvVar(  'STAGE', default =    'acquire').lower()
 
 else:
@@ -21,6 +22,10 @@ else:
     BRANCH  = GetEnvVar( 'BRANCH', default = 'INVALID').lower()    
     STAGE   = GetEnvVar(  'STAGE', default = 'INVALID').lower()
 
+# write shards of the progress index partition key, 1 leaves StageState unsharded
+SHARDS = GetEnvVar('SHARDS', default = '1')
+SHARDS = int(SHARDS) if SHARDS.isdigit() else 1
+
 # endregion
 
 # region Construct Resource Names
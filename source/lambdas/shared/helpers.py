@@ -2,11 +2,14 @@
 # SPDX-License-Identifier: MIT-0
 
 
-from      sys import modules
-from       os import getenv, popen, times
-from     json import loads
-from datetime import datetime
-from       re import sub
+from       sys import modules
+from        os import getenv, popen, times
+from      json import loads, dumps
+from  datetime import datetime
+from        re import sub
+from   pathlib import Path
+from      time import time
+from functools import lru_cache, wraps
 
 from shared.defines import *
 from shared.loggers import Logger
@@ -23,12 +26,56 @@ def GetCurrentStamp():
 
     return datetime.now().isoformat(sep = 'T', timespec = 'seconds')
 
+ENVIRON_CACHE     = Path(getenv('TDD_ENVIRON_CACHE', Path.home() / '.cache' / 'tdd' / 'environ.json'))
+ENVIRON_CACHE_TTL = 12 * 60 * 60 # seconds
+
+def Cached(function):
+    """
+    Memoize a slow local environment lookup, in process and across processes through ENVIRON_CACHE,
+    keyed by AWS profile. Failed lookups ('ERROR') are not kept.
+    """
+
+    @lru_cache(maxsize = None)
+    @wraps(function)
+    def cached():
+
+        key = f'{function.__name__}:{getenv("AWS_PROFILE", "default")}'
+
+        try:
+            entries = loads(ENVIRON_CACHE.read_text())
+        except Exception:
+            entries = {}
+
+        entry = entries.get(key)
+
+        if  entry and time() - entry['stamp'] < ENVIRON_CACHE_TTL:
+            return entry['value']
+
+        value = function()
+
+        if  value != 'ERROR':
+
+            entries[key] = {'value' : value, 'stamp' : time()}
+
+            try:
+                ENVIRON_CACHE.parent.mkdir(parents = True, exist_ok = True)
+                ENVIRON_CACHE.with_suffix('.tmp').write_text(dumps(entries))
+                ENVIRON_CACHE.with_suffix('.tmp').replace(ENVIRON_CACHE)
+            except Exception as e:
+                Logger.info(f'Environment cache not written to {ENVIRON_CACHE} : exception = {e}')
+
+        return value
+
+    return cached
+
+@Cached
 def GetAccount():
 
     result = loads(popen('aws sts get-caller-identity').read() or '{}')
 
     return result.get('Account', 'ERROR')
 
+@Cached
 def GetRegion():
 
     result = popen('aws configure get region').read() or 'us-east-1'
@@ -37,16 +84,25 @@ def GetRegion():
 
 def GetPrefix():
 
-    branch = popen('git rev-parse --abbrev-ref HEAD').read().strip().replace('_','').lower()
-    
     return f'tdd-{GetBranch()}'
 
+@lru_cache(maxsize = None)
 def GetBranch():
 
+  # read the checked out branch straight from the repository, git itself only for unusual layouts (e.g. worktrees)
+    for folder in [Path.cwd(), *Path.cwd().parents]:
+
+        head = folder / '.git' / 'HEAD'
+
+        if  head.is_file():
+            ref = head.read_text().strip()
+            return (ref.split('refs/heads/', 1)[1] if ref.startswith('ref:') else 'HEAD').replace('_','').lower()
+
     return popen('git rev-parse --abbrev-ref HEAD').read().strip().replace('_','').lower()
 
 def GetEnvVar(name, default = None):
-    """Safe environment variable load that explicitly errors rather than silently failing."""
+    """Safe environment variable load that explicitly errors rather than silently failing.
+    A callable default is only called when the variable is missing."""
 
     if  'pytest' in modules:
         # if this isn't mocked, provide some dummy string
@@ -56,6 +112,6 @@ def GetEnvVar(name, default = None):
 
     if  var is None:
         if  default is not None:
-            return default
+            return default() if callable(default) else default
         raise Exception(f'Failed to load environment variable: "{name}"')
     return var
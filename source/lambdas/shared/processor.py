@@ -7,79 +7,180 @@ from shared.helpers import *
 from shared.loggers import Logger
 
 from shared.database import Database
+from shared.document import DocumentEncoder
 from shared.action   import Action
 from shared.bus      import Bus
 from shared.message  import Message
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib         import contextmanager
+from threading          import Condition
+
 class BeginProcessor(object):
     def __init__(self, stage, actor, retryLimit, **kwArgs):
 
         self.stage      = stage
         self.actor      = actor
         self.retryLimit = retryLimit
+        self.budget     = None # most documents launched per cycle, most urgent Order first
+        self.reference  = True # actors receive a reference to hydrate rather than the whole document
+        self.batchSize  = 1    # documents packed into each actor invocation
 
         self.__dict__.update(kwArgs)
 
+    def getDocuments(self):
+        """
+        Documents ready to launch, by priority.
+        """
+
+        return Database.GetDocuments(
+            stages = [self.stage], states = [State.WAITING, State.HOLDING], limit = self.budget, ordered = True
+        )
+
     def process(self):
 
         self.processDocuments()
 
     def processDocuments(self):
 
-        exitLoop = 0
-        outcomes = []
+        """
+        Launch the actor for every ready document at once, stopping at the first throttled launch so
+        that the documents left over wait for the next cycle untouched. When actors receive references,
+        each invocation batch is claimed as RUNNING just before it is launched, and given back when
+        the launch is throttled.
+        """
 
-        for document in Database.GetDocuments(
-            stages = [self.stage], states = [State.WAITING, State.HOLDING]
-        ):
+        outcomes  = []
+        documents = {document.DocumentID : document for document in self.getDocuments()}
+        prior     = {}
 
-            status = Action.Invoke(
-                function_name = self.actor,
-                payload_bytes = document.to_json().encode('utf-8'),
-            )
+        queue    = list(documents)
+        size     = max(1, self.batchSize)
+        batches  = [tuple(queue[n : n + size]) for n in range(0, len(queue), size)]
+
+        def launches():
+
+            for batch in batches:
+
+                if  self.reference:
+                    claimed, claimedFrom = self.claimDocuments({documentID : documents[documentID] for documentID in batch})
+                    prior.update(claimedFrom)
+                    batch = tuple(documentID for documentID in batch if documentID in claimed)
+
+                if  batch:
+                    yield batch, self.actorPayload([documents[documentID] for documentID in batch])
 
-            outcomes.append(status)
+        with Database.BatchWriter() as writer:
 
-            if  status == PASS:
+            busy = {}
 
-                Logger.info(
-                    f'{self.stage.title()} Begin Processor : Launching Actor for DocumentID = {document.DocumentID}, Invoke = PASS'
-                )
+            for documentIDs, status in Action.InvokeMany(function_name = self.actor, payloads = launches()):
 
-                document.State                 = State.RUNNING
-                document.CurrentMap.ActorGrade = Grade.BUSY
-                document.CurrentMap.StartStamp = GetCurrentStamp()
+                for documentID in documentIDs:
 
-            else:
+                    document = documents.pop(documentID)
 
-                Logger.info(
-                    f'{self.stage.title()} Begin Processor : Launching Actor for DocumentID = {document.DocumentID}, Invoke = FAIL'
-                )
+                    outcomes.append(status)
 
-                document.State                  = State.HOLDING
-                document.CurrentMap.ActorGrade  = Grade.WAIT
-                document.CurrentMap.RetryCount += 1
+                    if  status == PASS:
 
-                if document.CurrentMap.RetryCount > self.retryLimit:
-                    document.State = State.FAILURE
+                        Logger.info(
+                            f'{self.stage.title()} Begin Processor : Launching Actor for DocumentID = {document.DocumentID}, Invoke = PASS'
+                        )
 
-                exitLoop = True
+                        if  self.reference:
+                            continue # claimed as RUNNING already
 
-            Database.PutDocument(document)
+                        self.markRunning(document)
 
-            if  exitLoop:
-                break
+                    elif status == BUSY:
+
+                        Logger.info(
+                            f'{self.stage.title()} Begin Processor : Launching Actor for DocumentID = {document.DocumentID}, Invoke = BUSY'
+                        )
+
+                        busy[documentID] = document # given back once the launches settle
+                        continue
+
+                    else:
+
+                        Logger.info(
+                            f'{self.stage.title()} Begin Processor : Launching Actor for DocumentID = {document.DocumentID}, Invoke = FAIL'
+                        )
+
+                        document.State                  = State.HOLDING
+                        document.CurrentMap.ActorGrade  = Grade.WAIT
+                        document.CurrentMap.RetryCount += 1
+
+                        if document.CurrentMap.RetryCount > self.retryLimit:
+                            document.State = State.FAILURE
+
+                    writer.UpdateDocument(document)
+
+            if  self.reference:
+                self.releaseDocuments(busy, prior, writer)
 
         Logger.info(
             f'{self.stage.title()} Begin Processor : {len(outcomes)} Documents Processed'
         )
 
+    def markRunning(self, document):
+
+        document.State                 = State.RUNNING
+        document.CurrentMap.ActorGrade = Grade.BUSY
+        document.CurrentMap.StartStamp = GetCurrentStamp()
+
+    def claimDocuments(self, documents):
+        """
+        Mark documents RUNNING ahead of their launch, so that the StageState their actor expects is
+        already stored. Documents taken meanwhile by another Begin are dropped. Returns the documents
+        claimed, along with what each was claimed from for releaseDocuments.
+        """
+
+        prior = {
+            documentID : (document.StageState, document.CurrentMap.ActorGrade, document.CurrentMap.StartStamp)
+            for documentID, document in documents.items()
+        }
+
+        with Database.BatchWriter() as writer:
+
+            for document in documents.values():
+                self.markRunning(document)
+                writer.UpdateDocument(document)
+
+        claimed = {documentID : document for documentID, document in documents.items() if writer.Outcomes.get(documentID.lower()) == PASS}
+
+        return claimed, {documentID : prior[documentID] for documentID in claimed}
+
+    def releaseDocuments(self, documents, prior, writer):
+        """
+        Give claimed documents that were never launched back to the StageState they were claimed from,
+        along with the ActorGrade and StartStamp the claim replaced.
+        """
+
+        for documentID, document in documents.items():
+            document.StageState, document.CurrentMap.ActorGrade, document.CurrentMap.StartStamp = prior[documentID]
+            writer.UpdateDocument(document)
+
+    def actorPayload(self, documents):
+        """
+        Event an actor is launched with, a single document as is and several under 'Documents'.
+        """
+
+        payloads = [Database.Reference(document) if self.reference else document.to_dict() for document in documents]
+        payload  = payloads[0] if len(payloads) == 1 else {'Documents' : payloads}
+
+        return dumps(payload, cls = DocumentEncoder).encode('utf-8')
+
 
 class AwaitProcessor(object):
-    def __init__(self, stage, timeoutMinutes):
+    def __init__(self, stage, timeoutMinutes, **kwArgs):
 
         self.stage          = stage
         self.timeoutMinutes = timeoutMinutes
+        self.concurrency    = 4 # consumers draining the stage event bus side by side
+
+        self.__dict__.update(kwArgs)
 
     def process(self):
 
@@ -90,58 +191,154 @@ class AwaitProcessor(object):
 
         """
         Process completion events from asynchronous requests coming through the stage event bus.
+        Several consumers drain the bus at once, while events for one document are never in flight
+        in two of them.
+        """
+
+        claims = DocumentClaims()
+
+        Bus.GetQueueUrl(self.stage) # resolve the queue once, ahead of the consumers
+
+        with ThreadPoolExecutor(max_workers = max(1, self.concurrency), thread_name_prefix = 'await') as executor:
+
+            consumers = [executor.submit(self.drainCallbackEvents, claims) for _ in range(max(1, self.concurrency))]
+
+            for consumer in consumers:
+                consumer.result()
+
+    def drainCallbackEvents(self, claims):
+
+        """
+        Consume the stage event bus until it runs dry. Each received batch of messages is resolved
+        against the database in a single consistent round trip once its documents are claimed, and
+        messages are deleted in batches once their document update has settled.
         """
 
-        for wrapper in Bus.GetMessages(stage = self.stage):
+        with Bus.Heartbeat(stage = self.stage) as heartbeat, \
+             Bus.Acknowledger(stage = self.stage, heartbeat = heartbeat) as acknowledger, \
+             Database.BatchWriter() as writer:
 
-            message  = Message(**loads(wrapper.body))
-            document = Database.GetDocument(document_id = message.DocumentID)
+            for wrappers in Bus.GetMessageBatches(stage = self.stage):
 
-            if  not document:
+                heartbeat.Hold(wrappers) # slow handling must not let the messages be delivered again
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.DocumentID}, Unable to Find in Database'
-                )
-                wrapper.delete()
+                events = [(wrapper, *self.parseCallbackEvent(wrapper)) for wrapper in wrappers]
+
+                with claims.Hold([documentID for _, documentID, _ in events]):
+
+                    documents = Database.GetDocumentsByIds([documentID for _, documentID, _ in events], consistent = True)
+                    applied   = []
+
+                    for wrapper, documentID, message in events:
+
+                        document = documents.get(documentID.lower())
+
+                        if  not document:
+
+                            Logger.info(
+                                f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {documentID}, Unable to Find in Database'
+                            )
+                            acknowledger.Acknowledge(wrapper)
+                            continue
+
+                        if  self.isSettled(document):
+
+                            Logger.info(
+                                f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {documentID}, Already Settled as {document.StageState}'
+                            )
+                            acknowledger.Acknowledge(wrapper)
+                            continue
+
+                        self.processCallbackEvent(document, message)
+
+                        writer.UpdateDocument(document)
+
+                        applied.append((wrapper, documentID))
+
+                  # settle the writes before letting go of the documents, so the next holder reads them
+                    writer.Flush()
+
+                    self.settleCallbackEvents(applied, writer.Outcomes, acknowledger, heartbeat)
+
+    def settleCallbackEvents(self, applied, outcomes, acknowledger, heartbeat):
+        """
+        Acknowledge the messages whose update was written. An update superseded by a concurrent writer
+        is acknowledged only when a fresh read shows the document settled; otherwise, like a failed
+        update, its message is let go to be delivered again.
+        """
+
+        raced   = [documentID for _, documentID in applied if outcomes.get(documentID.lower()) == RACE]
+        settled = Database.GetDocumentsByIds(raced, consistent = True) if raced else {}
+
+        for wrapper, documentID in applied:
+
+            outcome  = outcomes.get(documentID.lower())
+            document = settled.get(documentID.lower())
+
+            if  outcome in (PASS, SKIP) or (outcome == RACE and document and self.isSettled(document)):
+                acknowledger.Acknowledge(wrapper)
                 continue
 
-            # absorb message.MapUpdates into document
-            for key, value in message.MapUpdates.items():
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {documentID}, Update is {outcome.upper() if outcome else FAIL.upper()}, Left for Redelivery'
+            )
+
+            heartbeat.Release([wrapper])
+
+    def isSettled(self, document):
+        """
+        Whether a callback arrives for a document already past this stage's await, i.e. a redelivery.
+        """
+
+        return document.Stage.lower() != self.stage.lower() or document.State in (State.SUCCESS, State.FAILURE)
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Updating CurrentMap from Message > {key:>10} = {value}'
-                )
+    def parseCallbackEvent(self, wrapper):
+        """
+        Decode a stage event bus message, returning the DocumentID it refers to and the message itself.
+        """
 
-                setattr(document.CurrentMap, key, value) # TODO Fix StageS3Uri from becoming a Dictionary
+        message = Message(**loads(wrapper.body))
 
-            if  message.ActorGrade == Grade.PASS:
+        return message.DocumentID, message
 
-                document.State = State.SUCCESS
+    def processCallbackEvent(self, document, message):
+        """
+        Absorb a decoded callback message into its document.
+        """
 
-                self.processCallbackEventsMore(message)
+        # absorb message.MapUpdates into document
+        for key, value in message.MapUpdates.items():
 
-                document.CurrentMap.ActorGrade = message.ActorGrade
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Updating CurrentMap from Message > {key:>10} = {value}'
+            )
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.DocumentID}, Status is PASS'
-                )
+            setattr(document.CurrentMap, key, value) # TODO Fix StageS3Uri from becoming a Dictionary
 
-            else:
+        if  message.ActorGrade == Grade.PASS:
 
-                document.State                 = State.FAILURE
-                document.CurrentMap.ActorGrade = message.ActorGrade
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+            document.State = State.SUCCESS
 
-                self.processCallbackEventsMore(message)
+            self.processCallbackEventsMore(message)
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.DocumentID}, Status is FAIL'
-                )
+            document.CurrentMap.ActorGrade = message.ActorGrade
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
 
-            Database.PutDocument(document)
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.DocumentID}, Status is PASS'
+            )
 
-            wrapper.delete()
+        else:
+
+            document.State                 = State.FAILURE
+            document.CurrentMap.ActorGrade = message.ActorGrade
+            document.CurrentMap.FinalStamp = GetCurrentStamp()
+
+            self.processCallbackEventsMore(message)
+
+            Logger.info(
+                f'{self.stage.title()} Await Processor : Received Callback for DocumentID = {message.DocumentID}, Status is FAIL'
+            )
 
     def processCallbackEventsMore(self, message):
         pass
@@ -155,21 +352,59 @@ class AwaitProcessor(object):
 
             return datetime.now() > datetime.fromisoformat(begin_stamp) + timedelta(minutes = minutes)
 
-        for document in Database.GetDocuments(
-            stages = [self.stage], states = [State.RUNNING]
-        ):
+        with Database.BatchWriter() as writer:
+
+            for document in Database.GetDocuments(
+                stages = [self.stage], states = [State.RUNNING], projection = self.timeoutProjection()
+            ):
+
+                if  isOverTime(document.CurrentMap.StartStamp, minutes = self.timeoutMinutes):
+
+                    document.State                 = State.TIMEOUT
+                    document.CurrentMap.ActorGrade = Grade.TIME
+                    document.CurrentMap.FinalStamp = GetCurrentStamp()
+
+                    Logger.info(
+                        f'{self.stage.title()} Await Processor : Detected Time-Out for DocumentID = {document.DocumentID}'
+                    )
+
+                    writer.UpdateDocument(document)
+
+    def timeoutProjection(self):
+        """
+        Attributes read to decide on time-outs, and to record them.
+        """
+
+        return ['DocumentID', 'StageState', f'{self.stage.title()}Map.StartStamp']
+
+
+class DocumentClaims(object):
+
+    """
+    DocumentIDs currently held by a consumer. A consumer takes all the documents of a batch at once,
+    waiting while any of them is held elsewhere, so that holders never wait on each other.
+    """
+
+    def __init__(self):
+
+        self.held      = set()
+        self.condition = Condition()
 
-            if  isOverTime(document.CurrentMap.StartStamp, minutes = self.timeoutMinutes):
+    @contextmanager
+    def Hold(self, documentIDs):
 
-                document.State                 = State.TIMEOUT
-                document.CurrentMap.ActorGrade = Grade.TIME
-                document.CurrentMap.FinalStamp = GetCurrentStamp()
+        documentIDs = {documentID.lower() for documentID in documentIDs}
 
-                Logger.info(
-                    f'{self.stage.title()} Await Processor : Detected Time-Out for DocumentID = {document.DocumentID}'
-                )
+        with self.condition:
+            self.condition.wait_for(lambda: self.held.isdisjoint(documentIDs))
+            self.held |= documentIDs
 
-                Database.PutDocument(document)
+        try:
+            yield documentIDs
+        finally:
+            with self.condition:
+                self.held -= documentIDs
+                self.condition.notify_all()
 
 
 class ActorProcessor(object):
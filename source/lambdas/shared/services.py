@@ -1,8 +1,7 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-from boto3.session import Session
-from boto3 import resource, client
+from shared.clients import resource, client
 
 ddb = client("dynamodb")
 a2i = client("sagemaker-a2i-runtime")
@@ -2,11 +2,74 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
-from typing import Dict, List
+from io      import BytesIO
+from gzip    import GzipFile, compress
+from shutil  import copyfileobj
+from os      import getenv, utime
+from pathlib import Path
+from hashlib import sha256
+from uuid    import uuid4
+from typing  import Dict, List, Iterator, Iterable, Callable, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from shared.clients import S3Client, S3Resource
 
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+try:
+    import ijson # parses JSON straight off the stream, when bundled
+except ImportError:
+    ijson = None
+
+try:
+    import zstandard # zstd ContentEncoding, when bundled
+except ImportError:
+    zstandard = None
+
 from dataclasses import asdict, dataclass, fields, _MISSING_TYPE
 
+# uploads and copies beyond the threshold go in concurrent parts
+TRANSFER = TransferConfig(
+    multipart_threshold = 8 * 1024 * 1024,
+    multipart_chunksize = 8 * 1024 * 1024,
+    max_concurrency     = 10,
+)
+
+def encode(body : bytes, encoding : str = None) -> bytes:
+    """
+    Body compressed for the given ContentEncoding, gzip or zstd, or as is without one
+    """
+
+    if  not encoding:
+        return body
+
+    if  encoding == 'gzip':
+        return compress(body)
+
+    if  encoding == 'zstd' and zstandard:
+        return zstandard.ZstdCompressor().compress(body)
+
+    raise ValueError(f'Unsupported ContentEncoding {encoding}')
+
+def decode(stream, encoding : str = None):
+    """
+    Readable stream of the decompressed body, for a stream stored with the given ContentEncoding
+    """
+
+    if  encoding == 'gzip':
+        decoded = GzipFile(fileobj = stream, mode = 'rb')
+        decoded.myfileobj = stream # closed along with the decoded stream
+        return decoded
+
+    if  encoding == 'zstd':
+
+        if  not zstandard:
+            raise ValueError(f'Unsupported ContentEncoding {encoding}')
+
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+
+    return stream
+
 @dataclass
 class S3Uri:
     Bucket: str = ''
@@ -30,8 +93,45 @@ class S3Uri:
         return self.Object.split('/')[-1].split('.')[-1]
 
     def Get(self) -> bytearray:
-        
-        response = S3Resource.Object(bucket_name = self.Bucket, key = self.Key).get()
+
+        if  S3Cache.Limit:
+            return S3Cache.Fetch(self).read_bytes()
+
+        body = self.Open()
+
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def Open(self):
+        """
+        Streaming body of the object, to read it like a file without holding all of it in memory,
+        decompressed according to its ContentEncoding. Reads go through the client, as they may run
+        on GetMany worker threads, unlike the Object resource
+        """
+
+        response = S3Client.get_object(Bucket = self.Bucket, Key = self.Key)
+
+        return decode(response['Body'], response.get('ContentEncoding'))
+
+    def Stream(self, chunk_size = 1024 * 1024) -> Iterator[bytes]:
+
+        body = self.Open()
+
+        try:
+            yield from iter(lambda: body.read(chunk_size), b'')
+        finally:
+            body.close()
+
+    def GetRange(self, start : int, end : int = None) -> bytearray:
+        """
+        Bytes start to end of the object as stored, both included, or its last -start bytes when start is negative
+        """
+
+        range = f'bytes={start}' if start < 0 else f'bytes={start}-{"" if end is None else end}'
+
+        response = S3Client.get_object(Bucket = self.Bucket, Key = self.Key, Range = range)
 
         return response['Body'].read()
 
@@ -40,16 +140,58 @@ class S3Uri:
         return self.Get().decode('utf-8')
 
     def GetJSON(self) -> Dict:
-        
-        return json.loads(self.GetText())
 
-    def Put(self, body : bytearray = b'', contentType = 'application/octet-stream'):
+        body = S3Cache.Fetch(self).open('rb') if S3Cache.Limit else self.Open()
+
+        try:
+            return next(ijson.items(body, '', use_float = True)) if ijson else json.load(body)
+        finally:
+            body.close()
+
+    def Put(self, body : bytearray = b'', contentType = 'application/octet-stream', contentEncoding = None):
+        """
+        Store the body, compressed first when a ContentEncoding is given
+        """
+
+        body  = encode(body, contentEncoding)
+        extra = {'ContentEncoding' : contentEncoding} if contentEncoding else {}
+
+        if  len(body) > TRANSFER.multipart_threshold:
+            return self.Upload(BytesIO(body), contentType = contentType, contentEncoding = contentEncoding)
+
+        S3Resource.Object(bucket_name = self.Bucket, key = self.Key).put(Body = body, ContentType = contentType, **extra)
+
+    def Upload(self, source, contentType = 'application/octet-stream', contentEncoding = None):
+        """
+        Upload from a file path or a readable stream, in concurrent parts when it is large. The source
+        is sent as is, contentEncoding only describes how it is already compressed
+        """
+
+        extra = {'ContentType' : contentType}
+
+        if  contentEncoding:
+            extra['ContentEncoding'] = contentEncoding
+
+        if  isinstance(source, (str, Path)):
+            S3Client.upload_file(str(source), self.Bucket, self.Key, ExtraArgs = extra, Config = TRANSFER)
+        else:
+            S3Client.upload_fileobj(source, self.Bucket, self.Key, ExtraArgs = extra, Config = TRANSFER)
+
+    def CopyTo(self, target : 'S3Uri') -> 'S3Uri':
+        """
+        Copy the object within S3, in concurrent parts when it is large, without its bytes passing through here
+        """
+
+        S3Client.copy({'Bucket' : self.Bucket, 'Key' : self.Key}, target.Bucket, target.Key, Config = TRANSFER)
 
-        S3Resource.Object(bucket_name = self.Bucket, key = self.Key).put(Body = body, ContentType = contentType)
+        return target
 
-    def PutJSON(self, body : Dict = {}):
+    def PutJSON(self, body : Dict = {}, encoding : str = None):
+        """
+        Store the body as JSON, gzip or zstd compressed when an encoding is given, read back by GetJSON either way
+        """
 
-        self.Put(json.dumps(body).encode(), contentType = 'application/json')
+        self.Put(json.dumps(body).encode(), contentType = 'application/json', contentEncoding = encoding)
 
     def List(self, key_predicate = lambda x : True) -> List['S3Uri']:
 
@@ -66,9 +208,120 @@ class S3Uri:
             if  not params['ContinuationToken'] :
                 break
 
+    def ListAndFetch(self, key_predicate = lambda x : True, reader : Callable = None, max_workers : int = 8) -> Iterator[Tuple['S3Uri', Any]]:
+        """
+        Read every object under the prefix, downloading while the listing carries on
+        """
+
+        return S3Uri.GetMany(self.List(key_predicate), reader = reader, max_workers = max_workers)
+
+    @staticmethod
+    def GetMany(uris : Iterable['S3Uri'], reader : Callable = None, max_workers : int = 8) -> Iterator[Tuple['S3Uri', Any]]:
+        """
+        Read objects on a bounded pool of threads, yielding (uri, content) as each read completes, in no
+        particular order. reader is S3Uri.Get unless given, e.g. S3Uri.GetJSON
+        """
+
+        reader = reader or S3Uri.Get
+        uris   = iter(uris)
+
+        with ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'storage') as executor:
+
+            inflight = {}
+
+            while True:
+
+                while len(inflight) < max_workers:
+
+                    uri = next(uris, None)
+
+                    if  uri is None:
+                        break
+
+                    inflight[executor.submit(reader, uri)] = uri
+
+                if  not inflight:
+                    break
+
+                settled, _ = wait(inflight, return_when = FIRST_COMPLETED)
+
+                for future in settled:
+                    yield inflight.pop(future), future.result()
+
     @classmethod
     def FromUrl(cls, url: str):
 
         b,o = url.lower().strip('s3://').split('/', 1)
 
         return cls(Bucket = b, Object = o)
+
+class S3Cache:
+    """
+    Read-through cache of whole objects under /tmp, for warm containers reading the same objects again.
+    Entries are keyed by bucket, key and ETag, revalidated with a conditional get on every read, and
+    evicted least recently used first once they outgrow Limit bytes. Off while Limit is 0.
+    """
+
+    Folder = Path(getenv('S3_CACHE_FOLDER', '/tmp/s3-cache'))
+    Limit  = int(getenv('S3_CACHE_BYTES', '0'))
+
+    @staticmethod
+    def Fetch(uri : S3Uri) -> Path:
+        """
+        Local copy of the object, downloaded only when missing or changed, kept decompressed
+        """
+
+        name   = sha256(f'{uri.Bucket}/{uri.Key}'.encode()).hexdigest()
+        cached = next((entry for entry in S3Cache.Folder.glob(f'{name}.*') if entry.suffix != '.part'), None)
+        params = {'Bucket' : uri.Bucket, 'Key' : uri.Key}
+
+        if  cached:
+            params['IfNoneMatch'] = f'"{cached.suffix[1:]}"'
+
+        try:
+
+            response = S3Client.get_object(**params)
+
+        except ClientError as e:
+
+            if  cached and e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                utime(cached) # most recently used
+                return cached
+
+            raise
+
+        etag = response['ETag'].strip('"')
+        path = S3Cache.Folder / f'{name}.{etag}'
+        part = S3Cache.Folder / f'{name}.{uuid4().hex}.part'
+
+        S3Cache.Folder.mkdir(parents = True, exist_ok = True)
+
+        with part.open('wb') as file, decode(response['Body'], response.get('ContentEncoding')) as body:
+            copyfileobj(body, file, 1024 * 1024)
+
+        part.replace(path)
+
+        if  cached and cached != path:
+            cached.unlink(missing_ok = True)
+
+        S3Cache.Evict(keep = path)
+
+        return path
+
+    @staticmethod
+    def Evict(keep : Path = None):
+
+        entries = sorted(
+            (entry for entry in S3Cache.Folder.glob('*') if entry.suffix != '.part'),
+            key = lambda entry: entry.stat().st_mtime
+        )
+        total   = sum(entry.stat().st_size for entry in entries)
+
+        for entry in entries:
+
+            if  total <= S3Cache.Limit:
+                break
+
+            if  entry != keep:
+                total -= entry.stat().st_size
+                entry.unlink(missing_ok = True)
@@ -13,7 +13,7 @@ from shared.bus      import Bus
 
 from os.path import splitext
 
-def ingestDocumentFromS3(notification):
+def ingestDocumentFromS3(notification, writer):
 
   # future enhancement: add manifest file to ingest documents, which can contain other meta information such as priority and
   # multiple sub-pages of a single document etc
@@ -35,7 +35,7 @@ def ingestDocumentFromS3(notification):
     bucket       = notification['s3']['bucket']['name']
     object       = notification['s3']['object']['key']
     create_stamp = notification['eventTime']
-    priority     = object.split('/')[1] if object.count('/') > 1 else '0' # initial priority
+    priority     = object.split('/')[1] if object.count('/') > 1 else '0' # initial priority, lower is more urgent
     document_id  = splitext(object.split('/')[-1])[0]
 
    #"<bucket>/acquire/<initial_priority>/<document_id>.pdf"
@@ -44,20 +44,27 @@ def ingestDocumentFromS3(notification):
 
     document.Stage = Stage.ACQUIRE
     document.State = State.WAITING
-    document.Order = priority
+    try:
+        document.Order = priority
+    except ValueError as e:
+        Logger.error(f'S3 Trigger : Rejecting Priority for DocumentID = {document.DocumentID}, Ingesting at Priority 0 > {e}')
+        document.Order = 0
     document.Stamp = create_stamp
+    document.Shard = Database.ShardOf(document_id)
 
     document.AcquireMap.StageS3Uri = S3Uri(Bucket = bucket, Object = object)
 
     Logger.info(f'S3 Trigger : Ingesting New DocumentID = {document.DocumentID}, Priority = {document.Order}')
 
-    Database.PutDocument(document)
+    writer.PutDocument(document)
 
 def lambda_handler(event, context):
 
-    for record in event.get('Records', []):
+    with Database.BatchWriter() as writer:
 
-        ingestDocumentFromS3(notification = record)
+        for record in event.get('Records', []):
+
+            ingestDocumentFromS3(notification = record, writer = writer)
 
     Machine.RunDatabase()
 
@@ -0,0 +1,115 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from shared.defines import *
+from shared.environ import *
+from shared.loggers import Logger
+
+from shared.database import Database
+from shared.document import Document
+from shared.action   import Action
+
+STAGE_TRANSITIONS = dict(zip(STAGE_TRANSITIONS_ORDER, STAGE_TRANSITIONS_ORDER[1:]))
+
+def promoteDocumentFromStream(record, writer):
+
+    """
+    Promote a document whose StageState has just turned to SUCCESS, the same transition the promote
+    manager applies on its poll. The write is conditional on the SUCCESS StageState, so whichever of
+    the two gets there first wins and the other one backs off with RACE
+
+    Returns the stage the document is promoted to, or None when the record is not such a transition
+    """
+
+    images = record.get('dynamodb', {})
+
+    new_image = Database.Deserialize(images.get('NewImage', {}))
+    old_image = Database.Deserialize(images.get('OldImage', {}))
+
+    if  not new_image.get('StageState') or new_image['StageState'] == old_image.get('StageState'):
+        return None
+
+    document = Document.from_dict(new_image)
+
+    if  document.State != State.SUCCESS or document.Stage.lower() not in STAGE_TRANSITIONS:
+        return None
+
+    nextStage = STAGE_TRANSITIONS[document.Stage.lower()]
+
+    document.Stage = nextStage
+    document.State = State.WAITING
+
+    Logger.info(f'Stream Trigger : Promoting DocumentID = {document.DocumentID} To {document.StageState}')
+
+    writer.UpdateDocument(document)
+
+    return nextStage
+
+def lambda_handler(event, context):
+
+    promotions = {}
+
+    with Database.BatchWriter() as writer:
+
+        for record in event.get('Records', []):
+
+            if  record.get('eventName') != 'MODIFY':
+                continue
+
+            nextStage = promoteDocumentFromStream(record = record, writer = writer)
+
+            if  nextStage:
+                promotions[record['dynamodb']['Keys']['DocumentID']['S'].lower()] = nextStage
+
+    promoted = {}
+
+    for documentID, nextStage in promotions.items():
+        if  writer.Outcomes.get(documentID) == PASS:
+            promoted[nextStage] = promoted.get(nextStage, 0) + 1
+
+  # kick each stage that has new work once, the polling loop picks up anything this misses
+    for nextStage in promoted:
+        Action.Invoke(function_name = f'{PREFIX}-processor-{nextStage}-begin')
+
+    return {
+        'promoted' : promoted,
+        }
+
+if  __name__ == '__main__':
+
+  # DB:[ EX#Success ] -> DS -> LM -> DB:[ RE#Waiting ] -> RE:Begin
+
+    lambda_handler(
+        event =
+        {
+            'Records': [
+                {
+                'eventID': '1',
+                'eventName': 'MODIFY',
+                'eventVersion': '1.1',
+                'eventSource': 'aws:dynamodb',
+                'awsRegion': 'us-east-1',
+                'dynamodb': {
+                    'Keys': {
+                        'DocumentID': {'S': '001'}
+                    },
+                    'OldImage': {
+                        'DocumentID': {'S': '001'},
+                        'StageState': {'S': 'Extract#Running'},
+                        'OrderStamp': {'S': '1#1970-01-01T00:00:00.000Z'}
+                    },
+                    'NewImage': {
+                        'DocumentID': {'S': '001'},
+                        'StageState': {'S': 'Extract#Success'},
+                        'OrderStamp': {'S': '1#1970-01-01T00:00:00.000Z'}
+                    },
+                    'SequenceNumber': '111',
+                    'SizeBytes': 26,
+                    'StreamViewType': 'NEW_AND_OLD_IMAGES'
+                },
+                'eventSourceARN': 'arn:aws:dynamodb:us-east-1:123456789012:table/tdd-table-pipeline/stream/1970-01-01T00:00:00.000'
+                }
+            ]
+        },
+        context = None
+    )
@@ -4,14 +4,14 @@ from unittest import TestCase
 from unittest.mock import patch
 
 from shared.document import Document
-from shared.defines import Stage, State
+from shared.defines import Stage, State, PASS, RACE
 
 from processor.extract.begin import ExtractBeginProcessor
 from shared.clients import TextractClient
 
 
 @patch("shared.clients.TextractClient.start_document_analysis")
-@patch("shared.database.Database.PutDocument")
+@patch("shared.database.Database.UpdateDocument")
 @patch("shared.database.Database.GetDocuments")
 class TestProcessDocuments(TestCase):
     """Tests that we can catch transient errors in our try begin textract job function"""
@@ -26,7 +26,7 @@ class TestProcessDocuments(TestCase):
         self.doc = Document.from_dict(
             {
                 "DocumentID": "123",
-                "Stage": "EXTRACT",
+                "StageState": "Extract#Waiting",
                 "AcquireMap": {
                     "StageS3Uri": {"Bucket": "foo", "Object": "bar"},
                     "Exceptions": [{"something": "wrong"}],
@@ -35,22 +35,38 @@ class TestProcessDocuments(TestCase):
             }
         )
 
-    def test_successful_submit(self, get_docs_mock, put_doc_mock, start_mock):
+    def written(self, update_doc_mock):
+        """Record the StageState of every write, settling each one"""
+
+        writes = []
+
+        def update(document):
+            writes.append(document.StageState)
+            document.clean()
+            return PASS
+
+        update_doc_mock.side_effect = update
+
+        return writes
+
+    def test_successful_submit(self, get_docs_mock, update_doc_mock, start_mock):
         """Test a successful textract job creation."""
         get_docs_mock.return_value = [self.doc]
         start_mock.return_value = {
             "JobId": "id",
         }
+        writes = self.written(update_doc_mock)
 
         self.extract_begin_process.processDocuments()
 
         start_mock.assert_called_once()
-        put_doc_mock.assert_called_once()
 
-        doc = put_doc_mock.call_args[0][0]
+        doc = update_doc_mock.call_args[0][0]
+        self.assertEqual(writes, ["Extract#Running", "Extract#Running"])
         self.assertEqual(doc.State, State.RUNNING)
+        self.assertEqual(doc.CurrentMap.TextractID, "id")
 
-    def test_transient_error(self, get_docs_mock, put_doc_mock, start_mock):
+    def test_transient_error(self, get_docs_mock, update_doc_mock, start_mock):
         """Test a transient error textract job creation."""
         get_docs_mock.return_value = [self.doc]
 
@@ -60,15 +76,46 @@ class TestProcessDocuments(TestCase):
             )
 
         start_mock.side_effect = raise_err
+        writes = self.written(update_doc_mock)
 
         self.extract_begin_process.processDocuments()
 
         start_mock.assert_called_once()
-        put_doc_mock.assert_called_once()
 
-        doc = put_doc_mock.call_args[0][0]
+        doc = update_doc_mock.call_args[0][0]
+        self.assertEqual(writes, ["Extract#Running", "Extract#Holding"])
         self.assertEqual(doc.State, State.HOLDING)
 
+    def test_error_holds_only_failing_document(self, get_docs_mock, update_doc_mock, start_mock):
+        """Test an unexpected error holding its own document while the next one is still submitted."""
+        other = Document.from_dict({"DocumentID": "456", "StageState": "Extract#Waiting"})
+        get_docs_mock.return_value = [self.doc, other]
+
+        def start(**kwargs):
+            if  kwargs["JobTag"] == "123":
+                raise TextractClient.exceptions.InvalidS3ObjectException(
+                    operation_name="name", error_response={}
+                )
+            return {"JobId": "id"}
+
+        start_mock.side_effect = start
+        writes = self.written(update_doc_mock)
+
+        self.extract_begin_process.processDocuments()
+
+        self.assertEqual(start_mock.call_count, 2)
+        self.assertEqual(writes, ["Extract#Running", "Extract#Holding", "Extract#Running", "Extract#Running"])
+
+    def test_claimed_before_submit(self, get_docs_mock, update_doc_mock, start_mock):
+        """Test no textract job started for a document claimed meanwhile by another begin."""
+        get_docs_mock.return_value = [self.doc]
+        update_doc_mock.return_value = RACE
+
+        self.extract_begin_process.processDocuments()
+
+        start_mock.assert_not_called()
+        update_doc_mock.assert_called_once()
+
 
 if __name__ == "__main__":
     unittest.main()
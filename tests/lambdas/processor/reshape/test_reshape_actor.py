@@ -70,7 +70,7 @@ class TestReshape(TestCase):
         Tests sending textract output with two pages and two tables per page through reshape
         """
         document_id = "test-reshape-document"
-        def mock_put_json_object_s3(data):
+        def mock_put_json_object_s3(data, encoding = None):
             """Mock call to S3 API"""
             # Ensure there are two pages
             assert data["numPages"] == 2
@@ -114,7 +114,7 @@ class TestReshape(TestCase):
         Tests sending textract output with six pages through reshape
         """
         document_id = "test-reshape-document"
-        def mock_put_json_object_s3(data):
+        def mock_put_json_object_s3(data, encoding = None):
             """Mock call to S3 API"""
             # Ensure there are five pages
             assert data["numPages"] == 6
@@ -178,7 +178,7 @@ class TestReshape(TestCase):
         def mock_get_json_object_s3(s3_uri):
             return self.mock_textract_s3_uris[s3_uri]
 
-        def mock_put_json_object_s3(data):
+        def mock_put_json_object_s3(data, encoding = None):
             """Mock call to S3 API"""
             # Ensure there are six pages
             assert data["numPages"] == 6
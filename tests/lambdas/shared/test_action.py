@@ -0,0 +1,47 @@
+from unittest      import main, TestCase
+from unittest.mock import patch
+
+from shared.action  import Action
+from shared.clients import LambdaClient
+from shared.defines import PASS, FAIL, BUSY
+
+class TestCase(TestCase):
+    @patch('shared.action.LambdaClient.invoke')
+    def test_invoke_reports_throttling(self, invoke):
+        """Tell a throttled invocation apart from a failed one"""
+
+        invoke.side_effect = LambdaClient.exceptions.TooManyRequestsException(
+            operation_name = 'Invoke', error_response = {'Error' : {'Code' : 'TooManyRequestsException'}}
+        )
+
+        self.assertEqual(Action.Invoke('actor'), BUSY)
+
+        invoke.side_effect  = None
+        invoke.return_value = {'StatusCode' : 500}
+
+        self.assertEqual(Action.Invoke('actor'), FAIL)
+
+    @patch('shared.action.Action.Invoke')
+    def test_invoke_many_collects_outcomes(self, invoke):
+        """Invoke every payload, carrying on past failures"""
+
+        invoke.side_effect = lambda function_name, payload_bytes: FAIL if payload_bytes == b'2' else PASS
+
+        outcomes = dict(Action.InvokeMany('actor', ((f'{n}', f'{n}'.encode()) for n in range(40)), max_workers = 4))
+
+        self.assertEqual(len(outcomes), 40)
+        self.assertEqual(outcomes['2'], FAIL)
+        self.assertEqual(list(outcomes.values()).count(PASS), 39)
+
+    @patch('shared.action.Action.Invoke')
+    def test_invoke_many_stops_on_throttling(self, invoke):
+        """Stop launching once throttled, leaving the rest of the payloads alone"""
+
+        invoke.side_effect = lambda function_name, payload_bytes: BUSY if payload_bytes == b'0' else PASS
+
+        outcomes = dict(Action.InvokeMany('actor', ((f'{n}', f'{n}'.encode()) for n in range(100)), max_workers = 1))
+
+        self.assertEqual(outcomes, {'0' : BUSY})
+
+if  __name__ == '__main__':
+    main()
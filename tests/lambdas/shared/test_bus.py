@@ -0,0 +1,204 @@
+from unittest      import main, TestCase
+from unittest.mock import patch, Mock
+
+from json          import dumps
+from uuid          import uuid4
+
+from botocore.exceptions import ClientError
+
+from shared.bus     import Bus, ReceivedMessage
+from shared.defines import PASS, FAIL
+
+class TestCase(TestCase):
+    def received(self, *bodies):
+
+        return {'Messages' : [{'ReceiptHandle' : body, 'Body' : body} for body in bodies]}
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_get_messages_survives_empty_receive(self, sqs_client, get_queue_url):
+        """Keep long polling past a single empty receive, stop after consecutive ones"""
+
+        sqs_client.receive_message.side_effect = [self.received('a', 'b'), {}, self.received('c'), {}, {}, self.received('d')]
+
+        messages = list(Bus.GetMessages(stage = 'extract'))
+
+        self.assertEqual([message.body for message in messages], ['a', 'b', 'c'])
+        self.assertEqual(sqs_client.receive_message.call_count, 5)
+        self.assertEqual(sqs_client.receive_message.call_args.kwargs['WaitTimeSeconds'], Bus.WAIT_SECONDS)
+        self.assertEqual(sqs_client.receive_message.call_args.kwargs['QueueUrl'], get_queue_url.return_value)
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_get_messages_respects_time_budget(self, sqs_client, get_queue_url):
+        """Stop receiving once the time budget is spent, even while messages keep coming"""
+
+        sqs_client.receive_message.return_value = self.received('a')
+
+        with patch('shared.bus.monotonic', side_effect = [0, 1, 2, 3, 4]):
+            batches = list(Bus.GetMessageBatches(stage = 'extract', time_budget = 3))
+
+        self.assertEqual([[message.body for message in batch] for batch in batches], [['a'], ['a']])
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_acknowledger_deletes_in_batches(self, sqs_client, get_queue_url):
+        """Delete acknowledged messages ten at a time"""
+
+        sqs_client.delete_message_batch.return_value = {'Successful' : []}
+
+        with Bus.Acknowledger(stage = 'extract') as acknowledger:
+            for n in range(23):
+                acknowledger.Acknowledge(Mock(receipt_handle = f'handle-{n}', message_attributes = None))
+
+        batches = [call.kwargs['Entries'] for call in sqs_client.delete_message_batch.call_args_list]
+
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 3])
+        self.assertEqual(batches[2][0], {'Id' : '0', 'ReceiptHandle' : 'handle-20'})
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_del_messages_reports_failures(self, sqs_client, get_queue_url):
+        """Report a delete batch with failed entries"""
+
+        sqs_client.delete_message_batch.return_value = {'Failed' : [{'Id' : '0', 'Message' : 'gone'}]}
+
+        self.assertEqual(Bus.DelMessages(stage = 'extract', receipt_handles = [{'Id' : '0', 'ReceiptHandle' : 'x'}]), FAIL)
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_publisher_batches_by_count_and_size(self, sqs_client, get_queue_url):
+        """Send ten entries per request, and fewer when they would exceed the size limit"""
+
+        sqs_client.send_message_batch.return_value = {'Successful' : []}
+
+        with Bus.Publisher(stage = 'extract') as publisher:
+            for n in range(12):
+                publisher.PutMessage(message_body = 'x')
+            for n in range(5):
+                publisher.PutMessage(message_body = 'y' * Bus.COMPRESS_LIMIT)
+
+        batches = [call.kwargs['Entries'] for call in sqs_client.send_message_batch.call_args_list]
+
+        self.assertEqual([len(batch) for batch in batches], [10, 5, 2])
+        self.assertEqual(len({entry['Id'] for batch in batches for entry in batch}), 17)
+
+    @patch('shared.bus.sleep')
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_publisher_retries_failed_entries(self, sqs_client, get_queue_url, sleep):
+        """Resend only the entries that failed on the service side"""
+
+        sqs_client.send_message_batch.side_effect = [
+            {'Failed' : [{'Id' : '1', 'SenderFault' : False}, {'Id' : '2', 'SenderFault' : True}]},
+            {'Successful' : [{'Id' : '1'}]},
+        ]
+
+        with Bus.Publisher(stage = 'extract') as publisher:
+            for n in range(3):
+                publisher.PutMessage(message_body = f'{n}')
+
+        retried = sqs_client.send_message_batch.call_args_list[1].kwargs['Entries']
+
+        self.assertEqual(retried, [{'Id' : '1', 'MessageBody' : '1'}])
+        self.assertEqual(publisher.Failed, 1)
+
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_heartbeat_extends_held_messages(self, sqs_client, get_queue_url):
+        """Renew the visibility of held messages until they are acknowledged"""
+
+        sqs_client.delete_message_batch.return_value = {'Successful' : []}
+        sqs_client.change_message_visibility_batch.return_value = {'Successful' : []}
+
+        messages = [Mock(receipt_handle = f'handle-{n}', message_attributes = None) for n in range(12)]
+
+        heartbeat = Bus.Heartbeat(stage = 'extract')
+        heartbeat.Hold(messages)
+        heartbeat.Beat()
+
+        batches = [call.kwargs['Entries'] for call in sqs_client.change_message_visibility_batch.call_args_list]
+
+        self.assertEqual([len(batch) for batch in batches], [10, 2])
+        self.assertEqual(batches[0][0]['VisibilityTimeout'], Bus.VISIBILITY_SECONDS)
+
+        with Bus.Acknowledger(stage = 'extract', heartbeat = heartbeat) as acknowledger:
+            for message in messages[:11]:
+                acknowledger.Acknowledge(message)
+
+        self.assertEqual(list(heartbeat.Held), ['handle-11'])
+
+    def test_encode_leaves_small_bodies(self):
+        """Send bodies within the compression limit as they are"""
+
+        self.assertEqual(Bus.Encode('extract', '{"DocumentID": "a"}', {}), ('{"DocumentID": "a"}', {}))
+
+    @patch('shared.bus.S3Uri.Put')
+    def test_encode_round_trip(self, put):
+        """Gzip mid-size bodies, offload large ones, and restore both on receipt"""
+
+        mid = dumps({'Exceptions' : ['x' * 100] * 1000})
+        big = dumps({'Exceptions' : [str(uuid4()) for _ in range(20000)]})
+
+        body, attributes = Bus.Encode('extract', mid, {})
+
+        self.assertLess(len(body), len(mid))
+        self.assertEqual(attributes['ContentEncoding']['StringValue'], 'gzip')
+        put.assert_not_called()
+
+        received = ReceivedMessage({'ReceiptHandle' : 'a', 'Body' : body, 'MessageAttributes' : attributes})
+        self.assertEqual(Bus.Decode(received).body, mid)
+
+        body, attributes = Bus.Encode('extract', big, {})
+
+        self.assertTrue(body.startswith('s3://'))
+        self.assertEqual(attributes['ContentLocation']['StringValue'], body)
+        self.assertLessEqual(Bus.MessageSize(body, attributes), Bus.SIZE_LIMIT)
+
+        received = ReceivedMessage({'ReceiptHandle' : 'b', 'Body' : body, 'MessageAttributes' : attributes})
+
+        with patch('shared.bus.S3Uri.Get', return_value = put.call_args.args[0]):
+            self.assertEqual(Bus.Decode(received).body, big)
+
+    @patch('shared.bus.S3Uri.Get')
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_get_messages_skips_gone_claims(self, sqs_client, get_queue_url, get):
+        """Delete a redelivered message whose claim check is gone, and keep draining the others"""
+
+        location = {'ContentLocation' : {'DataType' : 'String', 'StringValue' : 's3://bucket/bus/extract/abc.json.gz'}}
+
+        sqs_client.receive_message.side_effect = [
+            {'Messages' : [
+                {'ReceiptHandle' : 'gone', 'Body' : location['ContentLocation']['StringValue'], 'MessageAttributes' : location},
+                {'ReceiptHandle' : 'kept', 'Body' : 'a'},
+            ]},
+            {}, {},
+        ]
+        sqs_client.delete_message_batch.return_value = {'Successful' : []}
+
+        get.side_effect = ClientError({'Error' : {'Code' : 'NoSuchKey'}}, 'GetObject')
+
+        messages = list(Bus.GetMessages(stage = 'extract'))
+
+        self.assertEqual([message.body for message in messages], ['a'])
+        sqs_client.delete_message_batch.assert_called_once_with(QueueUrl = get_queue_url.return_value, Entries = [{'Id' : '0', 'ReceiptHandle' : 'gone'}])
+
+    @patch('shared.bus.S3Client.delete_objects')
+    @patch('shared.bus.Bus.GetQueueUrl')
+    @patch('shared.bus.SQSClient')
+    def test_acknowledger_drops_claims(self, sqs_client, get_queue_url, delete_objects):
+        """Remove stored bodies of offloaded messages once they are deleted"""
+
+        sqs_client.delete_message_batch.return_value = {'Successful' : []}
+
+        location = {'ContentLocation' : {'DataType' : 'String', 'StringValue' : 's3://bucket/bus/extract/abc.json.gz'}}
+
+        with Bus.Acknowledger(stage = 'extract') as acknowledger:
+            acknowledger.Acknowledge(Mock(receipt_handle = 'a', message_attributes = location))
+            acknowledger.Acknowledge(Mock(receipt_handle = 'b', message_attributes = None))
+
+        delete_objects.assert_called_once_with(Bucket = 'bucket', Delete = {'Objects' : [{'Key' : 'bus/extract/abc.json.gz'}], 'Quiet' : True})
+
+if  __name__ == '__main__':
+    main()
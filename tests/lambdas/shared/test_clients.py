@@ -0,0 +1,32 @@
+from unittest      import main, TestCase
+from unittest.mock import patch
+
+from shared.clients import Clients, CONFIG, client
+
+class TestCase(TestCase):
+    def test_clients_created_on_first_use(self):
+        """Create a client only when used, once per process, with the shared config"""
+
+        lazy = client('kinesis')
+
+        self.assertNotIn(('client', 'kinesis'), Clients.Created)
+
+        endpoint = lazy.meta.endpoint_url
+
+        self.assertIn('kinesis', endpoint)
+        self.assertIs(client('kinesis').meta, lazy.meta)
+        self.assertEqual(lazy.meta.config.max_pool_connections, CONFIG.max_pool_connections)
+        self.assertEqual(lazy.meta.config.retries['mode'], 'adaptive')
+
+    def test_lazy_client_can_be_patched(self):
+        """Patch a lazy client's methods as if it were the client itself"""
+
+        lazy = client('kinesis')
+
+        with patch.object(lazy, 'list_streams', return_value = {'StreamNames' : []}):
+            self.assertEqual(lazy.list_streams(), {'StreamNames' : []})
+
+        self.assertNotIn('list_streams', lazy.__dict__)
+
+if  __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 from unittest      import main, TestCase
 from unittest.mock import patch, Mock
+from threading     import Lock
+from time          import sleep
 
 from shared.database import Database
 from shared.document import Document
+from shared.environ  import TABLE_PIPELINE
+from shared.defines  import RACE
+from shared.clients  import DynamoDBClient
 
 class TestCase(TestCase):
     @patch('shared.database.Database.Table.get_item')
@@ -24,6 +29,261 @@ class TestCase(TestCase):
 
         self.assertEqual(doc, response_doc)
 
+    @patch('shared.database.DynamoDBClient.get_paginator')
+    def test_get_documents_follows_pages(self, get_paginator):
+        """Fetch every page of every StageState key"""
+
+        pages = {
+            'Convert#Waiting' : [[{'DocumentID' : {'S' : 'a'}}], [{'DocumentID' : {'S' : 'b'}}]],
+            'Convert#Holding' : [[{'DocumentID' : {'S' : 'c'}, 'StageState' : {'S' : 'Convert#Holding'}}]],
+        }
+
+        def paginate(**kwargs):
+            stage_state = kwargs['ExpressionAttributeValues'][':StageState']['S']
+            return [{'Items' : items} for items in pages[stage_state]]
+
+        get_paginator.return_value.paginate.side_effect = paginate
+
+        documents = list(Database.GetDocuments(stages = ['convert'], states = ['waiting', 'holding']))
+
+        self.assertEqual(sorted(d.DocumentID for d in documents), ['a', 'b', 'c'])
+
+        documents = list(Database.GetDocuments(stages = ['convert'], states = ['waiting'], limit = 1))
+
+        self.assertEqual(len(documents), 1)
+
+    @patch('shared.database.Database.QUERY_WORKERS', 3)
+    @patch('shared.database.DynamoDBClient.get_paginator')
+    def test_get_documents_caps_workers(self, get_paginator):
+        """Query at most QUERY_WORKERS keys at once, queueing the others"""
+
+        lock, active, peak = Lock(), [0], [0]
+
+        def paginate(**kwargs):
+            with lock:
+                active[0] += 1
+                peak[0]    = max(peak[0], active[0])
+            sleep(0.01)
+            with lock:
+                active[0] -= 1
+            stage_state = kwargs['ExpressionAttributeValues'][':StageState']
+            return [{'Items' : [{'DocumentID' : stage_state, 'OrderStamp' : stage_state}]}]
+
+        get_paginator.return_value.paginate.side_effect = paginate
+
+        for ordered in (False, True):
+
+            peak[0]   = 0
+            query     = Database.QueryOrdered if ordered else Database.QueryProgress
+            documents = list(query([f'Convert#Waiting#{n}' for n in range(10)]))
+
+            self.assertEqual(len(documents), 10)
+            self.assertLessEqual(peak[0], 3)
+
+    @patch('shared.database.SHARDS', 3)
+    def test_sharded_stage_states(self):
+        """Fan out over every write shard as well as the unsharded key"""
+
+        self.assertEqual(Database.StageStates('extract', 'waiting'),
+                         ['Extract#Waiting', 'Extract#Waiting#0', 'Extract#Waiting#1', 'Extract#Waiting#2'])
+        self.assertEqual(Database.ShardOf('ABC'), Database.ShardOf('abc'))
+
+    @patch('shared.database.DynamoDBClient.get_paginator')
+    def test_get_documents_ordered(self, get_paginator):
+        """Merge StageState keys by OrderStamp"""
+
+        def item(document_id, order_stamp):
+            return {'DocumentID' : {'S' : document_id}, 'OrderStamp' : {'S' : order_stamp}}
+
+        pages = {
+            'Convert#Waiting' : [item('a', '0#2021-01-02'), item('b', '1#2021-01-01')],
+            'Convert#Holding' : [item('c', '0#2021-01-01'), item('d', '2#2021-01-01'), item('e', '0010#2021-01-01')],
+        }
+
+        def paginate(**kwargs):
+            return [{'Items' : pages[kwargs['ExpressionAttributeValues'][':StageState']['S']]}]
+
+        get_paginator.return_value.paginate.side_effect = paginate
+
+        documents = Database.GetDocuments(stages = ['convert'], states = ['waiting', 'holding'], ordered = True, limit = 3)
+
+        self.assertEqual([d.DocumentID for d in documents], ['c', 'a', 'b'])
+
+        documents = Database.GetDocuments(stages = ['convert'], states = ['waiting', 'holding'], ordered = True)
+
+        self.assertEqual([d.DocumentID for d in documents], ['c', 'a', 'b', 'd', 'e'])
+
+    @patch('shared.database.DynamoDBClient.get_paginator')
+    def test_get_documents_with_projection(self, get_paginator):
+        """Read only the projected attributes and refuse to put the partial view back whole"""
+
+        get_paginator.return_value.paginate.return_value = [{'Items' : [{
+            'DocumentID' : {'S' : 'a'},
+            'StageState' : {'S' : 'Extract#Running'},
+            'ExtractMap' : {'M' : {'StartStamp' : {'S' : '2021-01-01T00:00:00'}}},
+        }]}]
+
+        documents = list(Database.GetDocuments(stages = ['extract'], states = ['running'],
+                                               projection = ['DocumentID', 'StageState', 'ExtractMap.StartStamp']))
+
+        request = get_paginator.return_value.paginate.call_args[1]
+
+        self.assertEqual(request['ProjectionExpression'], '#DocumentID, #StageState, #ExtractMap.#StartStamp')
+        self.assertEqual(documents[0].CurrentMap.StartStamp, '2021-01-01T00:00:00')
+        self.assertTrue(documents[0].Partial)
+        self.assertRaises(Exception, Database.PutDocument, documents[0])
+
+    @patch('shared.database.sleep')
+    @patch('shared.database.DynamoDBClient.batch_get_item')
+    def test_get_documents_by_ids(self, batch_get_item, sleep):
+        """Fetch documents 100 keys at a time, resubmitting unprocessed keys"""
+
+        def get(RequestItems):
+            keys = RequestItems[TABLE_PIPELINE]['Keys']
+            done = keys[:-1] if len(keys) == 100 else keys
+            return {
+                'Responses'       : {TABLE_PIPELINE : done},
+                'UnprocessedKeys' : {TABLE_PIPELINE : {'Keys' : keys[len(done):]}} if len(done) < len(keys) else {},
+            }
+
+        batch_get_item.side_effect = get
+
+        documents = Database.GetDocumentsByIds([f'D{n:03d}' for n in range(150)] + ['D000'])
+
+        self.assertEqual(len(documents), 150)
+        self.assertEqual(documents['d042'].DocumentID, 'd042')
+        self.assertEqual([len(c[1]['RequestItems'][TABLE_PIPELINE]['Keys']) for c in batch_get_item.call_args_list], [100, 1, 50])
+        self.assertFalse(batch_get_item.call_args[1]['RequestItems'][TABLE_PIPELINE]['ConsistentRead'])
+
+        Database.GetDocumentsByIds(['D000'], consistent = True)
+
+        self.assertTrue(batch_get_item.call_args[1]['RequestItems'][TABLE_PIPELINE]['ConsistentRead'])
+
+    @patch('shared.database.DynamoDBClient.update_item')
+    def test_update_document_sends_changes_only(self, update_item):
+        """Update only the attributes changed since the document was read"""
+
+        update_item.return_value = {'ResponseMetadata' : {'HTTPStatusCode' : 200}}
+
+        doc = Document.from_dict({'DocumentID' : '123', 'StageState' : 'Extract#Waiting'})
+
+        self.assertEqual(Database.UpdateDocument(doc), 'skip')
+
+        doc.State                 = 'running'
+        doc.CurrentMap.TextractID = 'job'
+
+        self.assertEqual(Database.UpdateDocument(doc), 'pass')
+
+        request = update_item.call_args[1]
+
+        self.assertEqual(request['UpdateExpression'], 'SET #StageState = :v0, #ExtractMap.#TextractID = :v1')
+        self.assertEqual(request['ConditionExpression'], '#StageState = :prior')
+        self.assertEqual(request['ExpressionAttributeValues'][':prior'], {'S' : 'Extract#Waiting'})
+        self.assertEqual(doc.changes(), {})
+        self.assertEqual(doc.PriorStageState, 'Extract#Running')
+
+    @patch('shared.database.DynamoDBClient.update_item')
+    def test_update_document_detects_race(self, update_item):
+        """Skip the write when another writer has moved the document on"""
+
+        update_item.side_effect = DynamoDBClient.exceptions.ConditionalCheckFailedException(
+            error_response = {'Error' : {'Code' : 'ConditionalCheckFailedException'}},
+            operation_name = 'UpdateItem',
+        )
+
+        doc = Document.from_dict({'DocumentID' : '123', 'StageState' : 'Extract#Running'})
+        doc.State = 'timeout'
+
+        self.assertEqual(Database.UpdateDocument(doc), RACE)
+        self.assertEqual(doc.PriorStageState, 'Extract#Running')
+
+    @patch('shared.database.Database.UpdateDocument')
+    @patch('shared.database.Database.GetDocuments')
+    def test_promote_documents_counts_per_stage(self, get_documents, update_document):
+        """Promote every stage in one pass and count the promotions that were written"""
+
+        get_documents.return_value = [
+            Document.from_dict({'DocumentID' : 'a', 'StageState' : 'Acquire#Success'}),
+            Document.from_dict({'DocumentID' : 'b', 'StageState' : 'Extract#Success'}),
+            Document.from_dict({'DocumentID' : 'c', 'StageState' : 'Extract#Success'}),
+        ]
+
+        update_document.side_effect = lambda document: RACE if document.DocumentID == 'c' else 'pass'
+
+        promoted = Database.PromoteDocuments({'acquire' : 'convert', 'extract' : 'reshape', 'operate' : 'augment'})
+
+        self.assertEqual(promoted, {'acquire' : 1, 'extract' : 1, 'operate' : 0})
+        self.assertEqual(get_documents.call_args[0][0], ['acquire', 'extract', 'operate'])
+        self.assertEqual(update_document.call_args_list[0][0][0].StageState, 'Convert#Waiting')
+
+    @patch('shared.database.sleep')
+    @patch('shared.database.DynamoDBResource.batch_write_item')
+    def test_batch_writer_retries_unprocessed(self, batch_write_item, sleep):
+        """Buffer puts into batches of 25 and resubmit unprocessed items"""
+
+        committed = []
+        documents = [Document(DocumentID = f'D{n:02d}') for n in range(30)]
+
+        def write(RequestItems):
+            requests = list(RequestItems.values())[0]
+            if  batch_write_item.call_count == 1:
+                return {'UnprocessedItems' : {TABLE_PIPELINE : requests[-2:]}}
+            return {'UnprocessedItems' : {}}
+
+        batch_write_item.side_effect = write
+
+        with Database.BatchWriter() as writer:
+            for document in documents:
+                writer.PutDocument(document, on_commit = lambda d = document: committed.append(d.DocumentID))
+
+        self.assertEqual(batch_write_item.call_count, 3)
+        self.assertEqual(len(batch_write_item.call_args_list[0][1]['RequestItems'][TABLE_PIPELINE]), 25)
+        self.assertEqual(len(batch_write_item.call_args_list[1][1]['RequestItems'][TABLE_PIPELINE]), 2)
+        self.assertEqual(sorted(committed), [f'd{n:02d}' for n in range(30)])
+
+    @patch('shared.database.DynamoDBClient.update_item')
+    @patch('shared.database.DynamoDBResource.batch_write_item')
+    def test_batch_writer_keeps_condition_on_read_documents(self, batch_write_item, update_item):
+        """Write documents read from the table through a conditional update rather than an unconditional batch put"""
+
+        update_item.side_effect = DynamoDBClient.exceptions.ConditionalCheckFailedException({'Error' : {}}, 'UpdateItem')
+
+        document = Document.from_dict({'DocumentID' : '123', 'StageState' : 'Extract#Waiting'})
+        document.State = 'Running'
+
+        with Database.BatchWriter() as writer:
+            writer.PutDocument(document)
+
+        batch_write_item.assert_not_called()
+        self.assertEqual(update_item.call_args[1]['ExpressionAttributeValues'][':prior'], {'S' : 'Extract#Waiting'})
+        self.assertEqual(writer.Outcomes['123'], RACE)
+
+
+    @patch('shared.database.Database.GetDocumentsByIds')
+    def test_hydrate_documents(self, get_documents):
+        """Resolve references against the table in one round trip, refusing documents that moved on"""
+
+        stored = {}
+
+        for document_id in 'abc':
+            stored[document_id] = Document(DocumentID = document_id)
+            stored[document_id].Stage = 'Convert'
+            stored[document_id].State = 'Running'
+
+        get_documents.return_value = stored
+
+        snapshot  = Document(DocumentID = 'd').to_dict()
+        documents = Database.HydrateDocuments({'Documents' : [
+            Database.Reference(stored['a']),
+            {'DocumentID' : 'b', 'StageState' : 'Convert#Waiting'},
+            snapshot,
+            {'DocumentID' : 'c'},
+        ]})
+
+        self.assertEqual(documents, [stored['a'], None, Document.from_dict(snapshot), stored['c']])
+        get_documents.assert_called_once_with(['a', 'b', 'c'], consistent = True)
+
+        self.assertEqual(Database.HydrateDocuments(Database.Reference(stored['a'])), [stored['a']])
 
 if  __name__ == '__main__':
 
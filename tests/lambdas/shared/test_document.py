@@ -49,6 +49,46 @@ class TestCase(unittest.TestCase):
         self.maxDiff = None
         self.assertEqual(doc, parsedDoc)
 
+    def test_changes_after_load(self):
+        """Only attributes assigned after loading are reported as changes"""
+
+        doc = Document.from_dict({"DocumentID": "123", "StageState": "Extract#Waiting"})
+
+        self.assertEqual(doc.changes(), {})
+
+        doc.State = State.RUNNING
+        doc.CurrentMap.RetryCount += 1
+
+        self.assertEqual(doc.changes(), {"StageState": "Extract#Running", "ExtractMap.RetryCount": 1})
+
+        doc.clean()
+
+        self.assertEqual(doc.changes(), {})
+
+    def test_sharded_stage_state(self):
+        """Stage and State setters keep the write shard suffix"""
+
+        doc = Document(DocumentID="123", StageState="Extract#Waiting")
+        doc.Shard = 3
+
+        doc.State = State.RUNNING
+        doc.Stage = Stage.RESHAPE
+
+        self.assertEqual(doc.StageState, "reshape#Running#3")
+        self.assertEqual((doc.Stage, doc.State, doc.Shard), ("reshape", "running", 3))
+
+    def test_order_padded_and_checked(self):
+        """Order is stored zero-padded, and refused outside its fixed width"""
+
+        doc = Document(DocumentID="123", OrderStamp="0#2021-01-01")
+        doc.Order = "10"
+
+        self.assertEqual(doc.OrderStamp, "0010#2021-01-01")
+
+        for order in ("10000", "-1", "high"):
+            with self.assertRaises(ValueError):
+                doc.Order = order
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,48 @@
+from unittest      import main, TestCase
+from unittest.mock import patch, Mock
+from tempfile      import TemporaryDirectory
+from pathlib       import Path
+
+from shared import helpers
+
+class TestCase(TestCase):
+    def test_cached_lookup_survives_processes(self):
+        """Run a slow lookup once, then serve it from memory and from the cache file"""
+
+        with TemporaryDirectory() as folder, patch.object(helpers, 'ENVIRON_CACHE', Path(folder) / 'environ.json'):
+
+            lookup = Mock(return_value = '123456789012', __name__ = 'GetAccount')
+
+            self.assertEqual(helpers.Cached(lookup)(), '123456789012')
+            self.assertEqual(helpers.Cached(lookup)(), '123456789012') # fresh memo, as in a new process
+
+            lookup.assert_called_once()
+
+    def test_cached_lookup_skips_errors(self):
+        """Do not keep failed lookups"""
+
+        with TemporaryDirectory() as folder, patch.object(helpers, 'ENVIRON_CACHE', Path(folder) / 'environ.json'):
+
+            lookup = Mock(side_effect = ['ERROR', '123456789012'], __name__ = 'GetAccount')
+
+            self.assertEqual(helpers.Cached(lookup)(), 'ERROR')
+            self.assertEqual(helpers.Cached(lookup)(), '123456789012')
+
+    @patch('shared.helpers.popen')
+    def test_branch_read_without_git(self, popen):
+        """Read the branch from the repository HEAD without spawning git"""
+
+        helpers.GetBranch.cache_clear()
+
+        with TemporaryDirectory() as folder, patch('shared.helpers.Path.cwd', return_value = Path(folder) / 'source'):
+
+            (Path(folder) / '.git').mkdir()
+            (Path(folder) / '.git' / 'HEAD').write_text('ref: refs/heads/Feature_Branch\n')
+
+            self.assertEqual(helpers.GetBranch(), 'featurebranch')
+
+        helpers.GetBranch.cache_clear()
+        popen.assert_not_called()
+
+if  __name__ == '__main__':
+    main()
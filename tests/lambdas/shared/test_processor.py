@@ -0,0 +1,196 @@
+from unittest      import main, TestCase
+from unittest.mock import patch, Mock
+from threading     import Thread, Event
+
+from shared.processor import AwaitProcessor, BeginProcessor, DocumentClaims
+from shared.document  import Document
+from shared.message   import Message
+from shared.defines   import Stage, State, PASS, FAIL, BUSY, RACE
+from json             import loads
+
+class TestCase(TestCase):
+    def test_claims_exclude_held_documents(self):
+        """A consumer waits for documents held by another one, and only for those"""
+
+        claims  = DocumentClaims()
+        entered = Event()
+
+        def contend():
+            with claims.Hold(['B', 'c']):
+                entered.set()
+
+        with claims.Hold(['a', 'b']):
+
+            with claims.Hold(['d']):
+                pass
+
+            thread = Thread(target = contend)
+            thread.start()
+
+            self.assertFalse(entered.wait(0.1))
+
+        thread.join(1)
+
+        self.assertTrue(entered.is_set())
+        self.assertEqual(claims.held, set())
+
+    @patch('shared.bus.SQSClient')
+    @patch('shared.processor.Bus.GetQueueUrl')
+    @patch('shared.processor.Bus.GetMessageBatches')
+    @patch('shared.processor.Database.GetDocumentsByIds')
+    @patch('shared.database.Database.UpdateDocument')
+    def test_callbacks_drained_concurrently(self, update_document, get_documents, get_batches, get_queue_url, sqs_client):
+        """Every callback is applied and acknowledged once its update settles"""
+
+        def wrapper(document_id):
+            return Mock(body = Message(DocumentID = document_id, ActorGrade = PASS).to_json(), receipt_handle = document_id, message_attributes = None)
+
+        def documents(document_ids, consistent = False):
+            result = {}
+            for document_id in document_ids:
+                document = Document(DocumentID = document_id)
+                document.Stage = Stage.CONVERT
+                document.State = State.RUNNING
+                result[document_id] = document.clean()
+            return result
+
+        get_batches.side_effect      = [iter([[wrapper('a'), wrapper('b')]]), iter([[wrapper('c')]])]
+        get_documents.side_effect    = documents
+        update_document.return_value = PASS
+        sqs_client.delete_message_batch.return_value = {'Successful' : []}
+
+        AwaitProcessor(stage = Stage.CONVERT, timeoutMinutes = 30, concurrency = 2).processCallbackEvents()
+
+        updated = sorted(call.args[0].DocumentID for call in update_document.call_args_list)
+        deleted = sorted(entry['ReceiptHandle'] for call in sqs_client.delete_message_batch.call_args_list for entry in call.kwargs['Entries'])
+
+        self.assertEqual(updated, ['a', 'b', 'c'])
+        self.assertEqual(deleted, ['a', 'b', 'c'])
+        self.assertTrue(all(call.args[0].State == State.SUCCESS for call in update_document.call_args_list))
+
+    @patch('shared.processor.Database.GetDocumentsByIds')
+    def test_raced_callbacks_acknowledged_only_when_settled(self, get_documents):
+        """A superseded update is acknowledged only once a fresh read shows its document settled"""
+
+        def stored(document_id, state):
+            document = Document(DocumentID = document_id)
+            document.Stage = Stage.CONVERT
+            document.State = state
+            return document
+
+        get_documents.return_value = {'b' : stored('b', State.SUCCESS), 'c' : stored('c', State.WAITING)}
+
+        acknowledger, heartbeat = Mock(), Mock()
+        wrappers = {document_id : Mock(receipt_handle = document_id) for document_id in 'abcd'}
+
+        AwaitProcessor(stage = Stage.CONVERT, timeoutMinutes = 30).settleCallbackEvents(
+            [(wrappers[document_id], document_id.upper()) for document_id in 'abcd'],
+            {'a' : PASS, 'b' : RACE, 'c' : RACE, 'd' : FAIL},
+            acknowledger,
+            heartbeat
+        )
+
+        get_documents.assert_called_once_with(['B', 'C'], consistent = True)
+        self.assertEqual([call.args[0] for call in acknowledger.Acknowledge.call_args_list], [wrappers['a'], wrappers['b']])
+        self.assertEqual([call.args[0] for call in heartbeat.Release.call_args_list], [[wrappers['c']], [wrappers['d']]])
+
+    def test_settled_documents_are_skipped(self):
+        """Redelivered callbacks for documents already past the await are recognised"""
+
+        processor = AwaitProcessor(stage = Stage.CONVERT, timeoutMinutes = 30)
+        document  = Document(DocumentID = 'a')
+
+        document.Stage = Stage.CONVERT
+        document.State = State.RUNNING
+        self.assertFalse(processor.isSettled(document))
+
+        document.State = State.SUCCESS
+        self.assertTrue(processor.isSettled(document))
+
+        document.Stage = Stage.EXTRACT
+        document.State = State.WAITING
+        self.assertTrue(processor.isSettled(document))
+
+    @patch('shared.processor.Action.InvokeMany')
+    @patch('shared.database.Database.UpdateDocument')
+    def test_begin_claims_before_launching_references(self, update_document, invoke_many):
+        """Claim each batch as RUNNING just before its launch, give back a throttled one, leave the rest untouched"""
+
+        def waiting(document_id):
+            document = Document(DocumentID = document_id)
+            document.Stage = Stage.CONVERT
+            document.State = State.WAITING
+            return document.clean()
+
+        writes   = []
+        launched = []
+        released = []
+
+        def update(document):
+            writes.append((document.DocumentID, document.StageState))
+            if  document.State == State.WAITING:
+                released.append((document.CurrentMap.ActorGrade, document.CurrentMap.StartStamp))
+            outcome = RACE if (document.DocumentID, document.StageState) == ('a', 'Convert#Running') else PASS
+            if  outcome == PASS:
+                document.clean()
+            return outcome
+
+        update_document.side_effect = update
+
+        def invoke(function_name, payloads):
+            for key, payload in payloads:
+                launched.append(loads(payload))
+                yield key, BUSY if key == ('c',) else PASS
+                if  key == ('c',):
+                    return
+
+        invoke_many.side_effect = invoke
+
+        documents = [waiting('a'), waiting('b'), waiting('c'), waiting('d')]
+        before    = (documents[2].CurrentMap.ActorGrade, documents[2].CurrentMap.StartStamp)
+
+        processor = BeginProcessor(stage = Stage.CONVERT, actor = 'actor', retryLimit = 3)
+        processor.getDocuments = lambda: documents
+
+        processor.processDocuments()
+
+        self.assertEqual(launched, [{'DocumentID' : 'b', 'StageState' : 'Convert#Running'}, {'DocumentID' : 'c', 'StageState' : 'Convert#Running'}])
+        self.assertEqual(writes, [('a', 'Convert#Running'), ('b', 'Convert#Running'), ('c', 'Convert#Running'), ('c', 'Convert#Waiting')])
+        self.assertEqual(released, [before])
+
+    @patch('shared.processor.Action.InvokeMany')
+    @patch('shared.database.Database.UpdateDocument')
+    def test_begin_packs_documents_per_invocation(self, update_document, invoke_many):
+        """Pack up to batchSize document references into each actor invocation"""
+
+        def waiting(document_id):
+            document = Document(DocumentID = document_id)
+            document.Stage = Stage.OPERATE
+            document.State = State.WAITING
+            return document.clean()
+
+        def update(document):
+            document.clean()
+            return PASS
+
+        launched = []
+
+        def invoke(function_name, payloads):
+            for key, payload in payloads:
+                launched.append(loads(payload))
+                yield key, PASS
+
+        update_document.side_effect = update
+        invoke_many.side_effect     = invoke
+
+        processor = BeginProcessor(stage = Stage.OPERATE, actor = 'actor', retryLimit = 3, batchSize = 2)
+        processor.getDocuments = lambda: [waiting(document_id) for document_id in 'abcde']
+
+        processor.processDocuments()
+
+        self.assertEqual([[reference['DocumentID'] for reference in payload['Documents']] for payload in launched[:2]], [['a', 'b'], ['c', 'd']])
+        self.assertEqual(launched[2], {'DocumentID' : 'e', 'StageState' : 'Operate#Running'})
+        self.assertEqual(update_document.call_count, 5) # claims only
+
+if  __name__ == '__main__':
+    main()
@@ -3,10 +3,14 @@ import unittest
 import botocore
 import io
 
+from time     import sleep
+from tempfile import TemporaryDirectory
+from pathlib  import Path
+
 from unittest      import TestCase
 from unittest.mock import patch, Mock
 
-from shared.storage import S3Uri
+from shared.storage import S3Uri, S3Cache, TRANSFER, zstandard
 
 class TestServices(TestCase):
 
@@ -132,6 +136,244 @@ class TestServices(TestCase):
         # Ensure our mock methods were called
         s3_object_mock.get.assert_called_once()
 
+class TestStreaming(TestCase):
+
+    def body(self, content):
+
+        return botocore.response.StreamingBody(io.BytesIO(content), len(content))
+
+    @patch('shared.storage.S3Client')
+    def test_get_json_from_stream(self, mock_s3_client):
+        """
+        Tests JSON parsed off the stream, with and without ijson
+        """
+
+        data = {'pages' : [{'tables' : [1.5, 2]}], 'name' : 'é'}
+
+        for streaming in (True, False):
+
+            mock_s3_client.get_object.return_value = {'Body' : self.body(json.dumps(data).encode())}
+
+            with patch('shared.storage.ijson', __import__('ijson') if streaming else None):
+                self.assertEqual(S3Uri(Bucket = 'bucket', Object = 'key.json').GetJSON(), data)
+
+    @patch('shared.storage.S3Client')
+    def test_stream_and_range(self, mock_s3_client):
+        """
+        Tests chunked reads and ranged reads
+        """
+
+        get = mock_s3_client.get_object
+
+        get.return_value = {'Body' : self.body(b'0123456789')}
+
+        self.assertEqual(list(S3Uri(Bucket = 'bucket', Object = 'key').Stream(chunk_size = 4)), [b'0123', b'4567', b'89'])
+
+        get.return_value = {'Body' : self.body(b'234')}
+
+        self.assertEqual(S3Uri(Bucket = 'bucket', Object = 'key').GetRange(2, 4), b'234')
+        get.assert_called_with(Bucket = 'bucket', Key = 'key', Range = 'bytes=2-4')
+
+        S3Uri(Bucket = 'bucket', Object = 'key').GetRange(-3)
+        get.assert_called_with(Bucket = 'bucket', Key = 'key', Range = 'bytes=-3')
+
+        S3Uri(Bucket = 'bucket', Object = 'key').GetRange(5)
+        get.assert_called_with(Bucket = 'bucket', Key = 'key', Range = 'bytes=5-')
+
+class TestTransfer(TestCase):
+
+    @patch('shared.storage.S3Client')
+    def test_copy_server_side(self, mock_s3_client):
+        """
+        Tests copies handed to the managed, multipart capable copy
+        """
+
+        target = S3Uri(Bucket = 'store', Object = 'convert/d000/d000.pdf')
+
+        self.assertIs(S3Uri(Bucket = 'source', Object = 'acquire/d000.pdf').CopyTo(target), target)
+
+        args = mock_s3_client.copy.call_args
+
+        self.assertEqual(args.args, ({'Bucket' : 'source', 'Key' : 'acquire/d000.pdf'}, 'store', 'convert/d000/d000.pdf'))
+        self.assertIs(args.kwargs['Config'], TRANSFER)
+
+    @patch('shared.storage.S3Resource')
+    @patch('shared.storage.S3Client')
+    def test_put_large_uploads_in_parts(self, mock_s3_client, mock_s3_resource):
+        """
+        Tests small bodies put in one request and large ones handed to the multipart upload
+        """
+
+        S3Uri(Bucket = 'store', Object = 'small').Put(b'x')
+
+        mock_s3_resource.Object.return_value.put.assert_called_once()
+        mock_s3_client.upload_fileobj.assert_not_called()
+
+        S3Uri(Bucket = 'store', Object = 'large').Put(b'x' * (TRANSFER.multipart_threshold + 1), contentType = 'application/pdf')
+
+        args = mock_s3_client.upload_fileobj.call_args
+
+        self.assertEqual(args.args[1:], ('store', 'large'))
+        self.assertEqual(args.kwargs['ExtraArgs'], {'ContentType' : 'application/pdf'})
+
+        S3Uri(Bucket = 'store', Object = 'file').Upload('/tmp/file.pdf')
+
+        mock_s3_client.upload_file.assert_called_once_with('/tmp/file.pdf', 'store', 'file', ExtraArgs = {'ContentType' : 'application/octet-stream'}, Config = TRANSFER)
+
+class TestBulk(TestCase):
+
+    @patch('shared.storage.S3Client')
+    def test_list_and_fetch(self, mock_s3_client):
+        """
+        Tests every listed object read once, across listing pages, with at most max_workers reads at a time
+        """
+
+        mock_s3_client.list_objects_v2.side_effect = [
+            {'Contents' : [{'Key' : f'augment/123/primary/{n}.json'} for n in range(5)], 'NextContinuationToken' : 'next'},
+            {'Contents' : [{'Key' : f'augment/123/primary/{n}.json'} for n in range(5, 9)] + [{'Key' : 'augment/123/primary/skip'}]},
+        ]
+
+        active, peak = [0], [0]
+
+        def reader(uri):
+            active[0] += 1
+            peak[0]    = max(peak[0], active[0])
+            sleep(0.01)
+            active[0] -= 1
+            return uri.FileName
+
+        results = list(S3Uri(Bucket = 'store', Prefix = 'augment/123/primary').ListAndFetch(
+            key_predicate = lambda key : key.endswith('.json'), reader = reader, max_workers = 3
+        ))
+
+        self.assertEqual(sorted(content for _, content in results), [f'{n}' for n in range(9)])
+        self.assertTrue(all(uri.FileName == content for uri, content in results))
+        self.assertLessEqual(peak[0], 3)
+
+class TestCache(TestCase):
+
+    def setUp(self):
+
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+        patcher = patch.multiple(S3Cache, Folder = Path(self.folder.name), Limit = 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, content, etag):
+
+        return {'Body' : io.BytesIO(content), 'ETag' : f'"{etag}"'}
+
+    @patch('shared.storage.S3Client')
+    def test_miss_then_revalidated_hit(self, mock_s3_client):
+        """
+        Tests an object downloaded once, then served locally while S3 answers Not Modified
+        """
+
+        mock_s3_client.get_object.side_effect = [
+            self.response(b'{"a": 1}', 'v1'),
+            botocore.exceptions.ClientError({'Error' : {'Code' : '304'}}, 'GetObject'),
+        ]
+
+        uri = S3Uri(Bucket = 'store', Object = 'reshape/d001/humanInTheLoop.json')
+
+        self.assertEqual(uri.GetJSON(), {'a' : 1})
+        self.assertEqual(uri.Get(), b'{"a": 1}')
+
+        self.assertNotIn('IfNoneMatch', mock_s3_client.get_object.call_args_list[0].kwargs)
+        self.assertEqual(mock_s3_client.get_object.call_args_list[1].kwargs['IfNoneMatch'], '"v1"')
+
+    @patch('shared.storage.S3Client')
+    def test_changed_object_and_eviction(self, mock_s3_client):
+        """
+        Tests a changed object replacing its stale copy, and the least recently used entries evicted beyond Limit
+        """
+
+        mock_s3_client.get_object.side_effect = [
+            self.response(b'aaaa', 'v1'),
+            self.response(b'bbbb', 'v2'),
+            self.response(b'cccc', 'v3'),
+            self.response(b'dddd', 'v4'),
+        ]
+
+        first, second = S3Uri(Bucket = 'store', Object = 'first'), S3Uri(Bucket = 'store', Object = 'second')
+
+        self.assertEqual(first .Get(), b'aaaa')
+        self.assertEqual(first .Get(), b'bbbb')
+        self.assertEqual(len(list(S3Cache.Folder.iterdir())), 1)
+
+        self.assertEqual(second.Get(), b'cccc')
+        self.assertEqual(S3Uri(Bucket = 'store', Object = 'third').Get(), b'dddd')
+
+        self.assertEqual(sorted(entry.suffix for entry in S3Cache.Folder.iterdir()), ['.v3', '.v4'])
+
+class TestEncoding(TestCase):
+
+    def stored(self, mock_s3_resource):
+
+        stored = {}
+
+        def put(Body, ContentType, **kwArgs):
+            stored.update(Body = Body, ContentType = ContentType, **kwArgs)
+
+        def get(Bucket, Key):
+            return {'Body' : io.BytesIO(stored['Body']), 'ContentEncoding' : stored.get('ContentEncoding')}
+
+        mock_s3_resource.Object.return_value.put.side_effect = put
+
+        patcher = patch('shared.storage.S3Client.get_object', side_effect = get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        return stored
+
+    @patch('shared.storage.S3Resource')
+    def test_gzip_round_trip(self, mock_s3_resource):
+        """
+        Tests JSON stored gzipped with its ContentEncoding, and read back decompressed
+        """
+
+        stored = self.stored(mock_s3_resource)
+        body   = {'Cells' : [{'text' : 'x' * 100, 'confidence' : 99.5}] * 50}
+        uri    = S3Uri(Bucket = 'store', Object = 'reshape/d001/humanInTheLoop.json')
+
+        uri.PutJSON(body, encoding = 'gzip')
+
+        self.assertEqual(stored['ContentEncoding'], 'gzip')
+        self.assertLess(len(stored['Body']), len(json.dumps(body)))
+
+        self.assertEqual(uri.GetJSON(), body)
+        self.assertEqual(json.loads(uri.GetText()), body)
+
+    @unittest.skipUnless(zstandard, 'zstandard not installed')
+    @patch('shared.storage.S3Resource')
+    def test_zstd_round_trip(self, mock_s3_resource):
+        """
+        Tests JSON stored with zstd, and read back decompressed
+        """
+
+        stored = self.stored(mock_s3_resource)
+        uri    = S3Uri(Bucket = 'store', Object = 'operate/d001/humanInTheLoop-Operated.json')
+
+        uri.PutJSON({'a' : [1, 2, 3]}, encoding = 'zstd')
+
+        self.assertEqual(stored['ContentEncoding'], 'zstd')
+        self.assertEqual(uri.GetJSON(), {'a' : [1, 2, 3]})
+
+    @patch('shared.storage.S3Resource')
+    def test_plain_unchanged(self, mock_s3_resource):
+        """
+        Tests JSON stored as is without an encoding
+        """
+
+        stored = self.stored(mock_s3_resource)
+
+        S3Uri(Bucket = 'store', Object = 'key.json').PutJSON({'a' : 1})
+
+        self.assertNotIn('ContentEncoding', stored)
+        self.assertEqual(stored['Body'], b'{"a": 1}')
+
 if  __name__ == '__main__':
 
     unittest.main()
\ No newline at end of file
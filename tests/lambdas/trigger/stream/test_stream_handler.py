@@ -0,0 +1,100 @@
+from unittest      import TestCase
+from unittest.mock import patch
+
+from boto3.dynamodb.types import TypeSerializer
+
+from shared.document import Document
+from shared.defines  import Stage, State, PASS, RACE
+
+from trigger.stream.handler import lambda_handler
+
+
+def StreamRecord(old, new, event_name = 'MODIFY'):
+    """Build a synthetic DynamoDB stream record carrying the old and new image of a document"""
+
+    serializer = TypeSerializer()
+
+    def image(document):
+        return {key : serializer.serialize(value) for key, value in document.to_dict().items()}
+
+    return {
+        'eventName' : event_name,
+        'dynamodb'  : {
+            'Keys'     : {'DocumentID' : {'S' : new.DocumentID}},
+            'OldImage' : image(old),
+            'NewImage' : image(new),
+        },
+    }
+
+def Transition(document_id, stage, old_state, new_state):
+
+    old = Document(DocumentID = document_id)
+    old.Stage = stage
+    old.State = old_state
+
+    new = Document.from_dict(old.to_dict())
+    new.State = new_state
+
+    return StreamRecord(old, new)
+
+
+@patch('trigger.stream.handler.Action.Invoke')
+@patch('shared.database.Database.UpdateDocument')
+class TestStreamHandler(TestCase):
+    """Tests that SUCCESS writes seen on the stream promote the document and kick the next Begin"""
+
+    def test_promotes_success(self, update_document, invoke):
+        """A document reaching SUCCESS moves to the next stage and that stage is kicked once"""
+
+        update_document.return_value = PASS
+
+        response = lambda_handler(
+            event = {'Records' : [
+                Transition('a', Stage.EXTRACT, State.RUNNING, State.SUCCESS),
+                Transition('b', Stage.EXTRACT, State.RUNNING, State.SUCCESS),
+            ]},
+            context = None
+        )
+
+        self.assertEqual(response['promoted'], {Stage.RESHAPE : 2})
+        self.assertEqual(update_document.call_count, 2)
+
+        document = update_document.call_args[0][0]
+        self.assertEqual(document.StageState, 'Reshape#Waiting')
+        self.assertEqual(document.PriorStageState, 'Extract#Success')
+
+        invoke.assert_called_once()
+        self.assertTrue(invoke.call_args.kwargs['function_name'].endswith('-processor-reshape-begin'))
+
+    def test_ignores_other_writes(self, update_document, invoke):
+        """Writes that are not a fresh SUCCESS, or that finish the last stage, are left alone"""
+
+        unchanged = Transition('a', Stage.EXTRACT, State.SUCCESS, State.SUCCESS)
+        inserted  = Transition('b', Stage.EXTRACT, State.RUNNING, State.SUCCESS)
+        inserted['eventName'] = 'INSERT'
+
+        lambda_handler(
+            event = {'Records' : [
+                unchanged,
+                inserted,
+                Transition('c', Stage.EXTRACT, State.WAITING, State.RUNNING),
+                Transition('d', Stage.CATALOG, State.RUNNING, State.SUCCESS),
+            ]},
+            context = None
+        )
+
+        update_document.assert_not_called()
+        invoke.assert_not_called()
+
+    def test_race_lost_to_poll(self, update_document, invoke):
+        """When the promote manager got there first the stage is not kicked again"""
+
+        update_document.return_value = RACE
+
+        response = lambda_handler(
+            event = {'Records' : [Transition('a', Stage.CONVERT, State.RUNNING, State.SUCCESS)]},
+            context = None
+        )
+
+        self.assertEqual(response['promoted'], {})
+        invoke.assert_not_called()